@@ -0,0 +1,318 @@
+"""Notification preferences, alert rules and the email outbox.
+
+Each rule is one set-based SQL statement over every user at once (rollups,
+anomalies, goals and the price store joined with preferences), queueing
+messages into alert_outbox. The outbox's unique (user, kind, key) makes
+re-running the job a no-op for alerts already queued, so the scheduler can
+simply run it every few minutes:
+
+    python alerts.py --evaluate     # queue new alerts for all users
+    python alerts.py --drain        # send queued alerts via SMTP
+
+Any local SMTP server works as the delivery end, e.g.
+`python -m aiosmtpd -n -l localhost:1025`.
+"""
+import argparse
+import json
+import os
+import smtplib
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+
+import pandas as pd
+
+from db import connect, transaction
+from watchlists import normalize_symbol
+
+# ============ CONFIG ============
+# notification_prefs column -> settings label
+PREFERENCES = {
+    'unusual_expenses': "Email Alerts for Unusual Expenses",
+    'monthly_report': "Monthly Report",
+    'investment_alerts': "Investment Alerts",
+    'goal_alerts': "Goal Off-Track Alerts",
+}
+DIRECTIONS = ('above', 'below')
+ANOMALY_LOOKBACK_DAYS = 7  # unusual expenses older than this are not emailed
+GOAL_WARNING_DAYS = 60  # goals due this soon are off track below GOAL_WARNING_PROGRESS
+GOAL_WARNING_PROGRESS = 0.9
+SMTP_HOST = os.environ.get('FINANCE_SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('FINANCE_SMTP_PORT', '1025'))
+MAIL_FROM = os.environ.get('FINANCE_MAIL_FROM', 'alerts@finance-tracker.local')
+DRAIN_BATCH = 500
+
+# Dates and cut-offs shared by every rule in one evaluation. anomaly_since
+# is UTC in SQLite's datetime('now') format, to compare with detected_at.
+Clock = namedtuple('Clock', 'now today month last_month goal_soon anomaly_since')
+
+RULES = {}
+
+
+def rule(fn):
+    """Register `fn(conn, clock) -> alerts queued` as an alert rule."""
+    RULES[fn.__name__] = fn
+    return fn
+
+
+def _enabled(preference, alias='u'):
+    # Users without a prefs row get every notification
+    return f"""COALESCE((SELECT {preference} FROM notification_prefs p WHERE p.user_id = {alias}.id), 1) = 1
+               AND {alias}.email <> ''"""
+
+
+def make_clock(now=None):
+    now = now or datetime.now()
+    month_start = now.replace(day=1)
+    return Clock(
+        now.isoformat(timespec='seconds'),
+        now.strftime('%Y-%m-%d'),
+        now.strftime('%Y-%m'),
+        (month_start - timedelta(days=1)).strftime('%Y-%m'),
+        (now + timedelta(days=GOAL_WARNING_DAYS)).strftime('%Y-%m-%d'),
+        (now.astimezone(timezone.utc) - timedelta(days=ANOMALY_LOOKBACK_DAYS)).strftime('%Y-%m-%d %H:%M:%S'),
+    )
+
+
+# ============ RULES ============
+@rule
+def budget_overrun(conn, clock):
+    """Categories over their monthly budget this month; once per category and month."""
+    return conn.execute("""
+        INSERT OR IGNORE INTO alert_outbox (user_id, kind, key, subject, body, created_at)
+        SELECT u.id, 'budget', b.category || ':' || m.month,
+               'Budget exceeded: ' || b.category,
+               printf('You have spent ₹%.2f on %s in %s, over your monthly budget of ₹%.2f.',
+                      m.total, b.category, m.month, b.monthly_limit),
+               :now
+        FROM budgets b
+        JOIN users u ON u.id = b.user_id
+        JOIN expense_category_monthly m
+          ON m.user_id = b.user_id AND m.category = b.category AND m.month = :month
+        WHERE m.total > b.monthly_limit AND u.email <> ''
+    """, clock._asdict()).rowcount
+
+
+@rule
+def unusual_spend(conn, clock):
+    """Expenses flagged by the anomaly detector since the lookback cut-off."""
+    return conn.execute(f"""
+        INSERT OR IGNORE INTO alert_outbox (user_id, kind, key, subject, body, created_at)
+        SELECT u.id, 'anomaly', a.id,
+               'Unusual expense in ' || a.category,
+               printf('An expense of ₹%.2f on %s (%s) is well above your usual ₹%.2f for %s.',
+                      a.amount, e.date, COALESCE(NULLIF(e.description, ''), 'no description'),
+                      a.expected, a.category),
+               :now
+        FROM expense_anomalies a
+        JOIN users u ON u.id = a.user_id
+        JOIN expenses e ON e.id = a.expense_id
+        WHERE a.detected_at >= :anomaly_since AND {_enabled('unusual_expenses')}
+    """, clock._asdict()).rowcount
+
+
+@rule
+def goal_off_track(conn, clock):
+    """Unreached goals that are overdue or due soon with little saved; once per goal and month."""
+    return conn.execute(f"""
+        INSERT OR IGNORE INTO alert_outbox (user_id, kind, key, subject, body, created_at)
+        SELECT u.id, 'goal', g.id || ':' || :month,
+               'Goal off track: ' || g.name,
+               printf('You have saved ₹%.2f of ₹%.2f for "%s", due %s.',
+                      COALESCE(g.current_amount, 0), g.target_amount, g.name, g.target_date),
+               :now
+        FROM goals g
+        JOIN users u ON u.id = g.user_id
+        WHERE COALESCE(g.current_amount, 0) < g.target_amount
+          AND (g.target_date < :today
+               OR (g.target_date <= :goal_soon
+                   AND COALESCE(g.current_amount, 0) < {GOAL_WARNING_PROGRESS} * g.target_amount))
+          AND {_enabled('goal_alerts')}
+    """, clock._asdict()).rowcount
+
+
+@rule
+def monthly_report(conn, clock):
+    """Last month's total and top category, once per month."""
+    return conn.execute(f"""
+        INSERT OR IGNORE INTO alert_outbox (user_id, kind, key, subject, body, created_at)
+        SELECT u.id, 'report', m.month,
+               'Your spending report for ' || m.month,
+               printf('You spent ₹%.2f across %d expenses in %s. Your largest category was %s (₹%.2f).',
+                      m.total, m.count, m.month, top.category, top.total),
+               :now
+        FROM expense_monthly m
+        JOIN users u ON u.id = m.user_id
+        JOIN expense_category_monthly top
+          ON top.user_id = m.user_id AND top.month = m.month
+         AND top.category = (SELECT category FROM expense_category_monthly c
+                             WHERE c.user_id = m.user_id AND c.month = m.month
+                             ORDER BY total DESC, category LIMIT 1)
+        WHERE m.month = :last_month AND {_enabled('monthly_report')}
+    """, clock._asdict()).rowcount
+
+
+@rule
+def price_threshold(conn, clock):
+    """Active price alerts crossed by the latest stored close; each fires once."""
+    params = clock._asdict()
+    fired = conn.execute(f"""
+        WITH latest AS (
+            SELECT p.symbol, p.close
+            FROM prices p
+            JOIN (SELECT symbol, MAX(date) AS date FROM prices
+                  WHERE symbol IN (SELECT symbol FROM price_alerts WHERE triggered_at IS NULL)
+                  GROUP BY symbol) last
+              ON last.symbol = p.symbol AND last.date = p.date
+        )
+        UPDATE price_alerts
+        SET triggered_at = :now, triggered_price = latest.close
+        FROM latest
+        WHERE price_alerts.triggered_at IS NULL AND latest.symbol = price_alerts.symbol
+          AND CASE price_alerts.direction WHEN 'above' THEN latest.close >= price_alerts.threshold
+                                          ELSE latest.close <= price_alerts.threshold END
+          AND price_alerts.user_id IN (SELECT id FROM users u WHERE {_enabled('investment_alerts')})
+        RETURNING price_alerts.id
+    """, params).fetchall()
+    return queue_price_alerts(conn, [alert_id for alert_id, in fired])
+
+
+def queue_price_alerts(conn, alert_ids):
+    """Queue messages for the price alerts with `alert_ids`, which have just fired."""
+    if not alert_ids:
+        return 0
+    return conn.execute("""
+        INSERT OR IGNORE INTO alert_outbox (user_id, kind, key, subject, body, created_at)
+        SELECT user_id, 'price', id,
+               printf('%s is %s ₹%.2f', symbol, direction, threshold),
+               printf('%s traded at ₹%.2f, %s your alert threshold of ₹%.2f.',
+                      symbol, triggered_price, direction, threshold),
+               triggered_at
+        FROM price_alerts
+        WHERE id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(alert_ids),)).rowcount
+
+
+def evaluate(now=None, rules=None):
+    """Run every rule for all users in one transaction; returns {rule name: alerts queued}."""
+    clock = make_clock(now)
+    with transaction() as conn:
+        return {name: check(conn, clock) for name, check in (rules or RULES).items()}
+
+
+# ============ DELIVERY ============
+def drain(limit=None, host=SMTP_HOST, port=SMTP_PORT):
+    """Send queued alerts over one SMTP connection, oldest first; returns the number sent.
+
+    Each batch is marked sent only after all of its messages went out, so a
+    failure leaves the rest of the queue for the next run.
+    """
+    sent = 0
+    with smtplib.SMTP(host, port) as smtp:
+        while limit is None or sent < limit:
+            size = DRAIN_BATCH if limit is None else min(DRAIN_BATCH, limit - sent)
+            with connect() as conn:
+                batch = conn.execute("""
+                    SELECT o.id, u.email, o.subject, o.body
+                    FROM alert_outbox o JOIN users u ON u.id = o.user_id
+                    WHERE o.sent_at IS NULL
+                    ORDER BY o.id
+                    LIMIT ?
+                """, (size,)).fetchall()
+            if not batch:
+                break
+            for _, email, subject, body in batch:
+                message = EmailMessage()
+                message['From'], message['To'], message['Subject'] = MAIL_FROM, email, subject
+                message.set_content(body)
+                smtp.send_message(message)
+            sent_at = datetime.now().isoformat(timespec='seconds')
+            with transaction() as conn:
+                conn.executemany("UPDATE alert_outbox SET sent_at = ? WHERE id = ?",
+                                 [(sent_at, outbox_id) for outbox_id, *_ in batch])
+            sent += len(batch)
+    return sent
+
+
+# ============ SETTINGS ============
+def get_prefs(user_id):
+    """{preference: bool} for every PREFERENCES key."""
+    with connect() as conn:
+        row = conn.execute(f"SELECT {', '.join(PREFERENCES)} FROM notification_prefs WHERE user_id = ?",
+                           (user_id,)).fetchone()
+    return {name: bool(value) for name, value in zip(PREFERENCES, row or [1] * len(PREFERENCES))}
+
+
+def save_prefs(user_id, prefs):
+    columns = ', '.join(PREFERENCES)
+    with transaction() as conn:
+        conn.execute(f"""
+            INSERT INTO notification_prefs (user_id, {columns})
+            VALUES (?, {', '.join('?' * len(PREFERENCES))})
+            ON CONFLICT (user_id) DO UPDATE SET
+                {', '.join(f'{name} = excluded.{name}' for name in PREFERENCES)}
+        """, (user_id, *(int(bool(prefs[name])) for name in PREFERENCES)))
+
+
+def get_budgets(user_id):
+    """Monthly limits indexed by category."""
+    with connect() as conn:
+        return pd.read_sql_query("""
+            SELECT category, monthly_limit FROM budgets WHERE user_id = ? ORDER BY category
+        """, conn, params=(user_id,), index_col='category')['monthly_limit']
+
+
+def save_budgets(user_id, limits):
+    """Replace a user's budgets with {category: limit}; zero or blank limits are dropped."""
+    rows = [(user_id, category, float(limit)) for category, limit in limits.items()
+            if category and pd.notna(limit) and limit > 0]
+    with transaction() as conn:
+        conn.execute("DELETE FROM budgets WHERE user_id = ?", (user_id,))
+        conn.executemany("INSERT INTO budgets (user_id, category, monthly_limit) VALUES (?, ?, ?)", rows)
+
+
+def get_price_alerts(user_id):
+    with connect() as conn:
+        return pd.read_sql_query("""
+            SELECT id, symbol, direction, threshold, created_at, triggered_at, triggered_price
+            FROM price_alerts WHERE user_id = ? ORDER BY triggered_at IS NOT NULL, symbol, threshold
+        """, conn, params=(user_id,))
+
+
+def add_price_alert(user_id, symbol, direction, threshold):
+    symbol = normalize_symbol(symbol)
+    if not symbol or direction not in DIRECTIONS or threshold <= 0:
+        raise ValueError("Enter a symbol, a direction and a positive price.")
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO price_alerts (user_id, symbol, direction, threshold, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, symbol, direction, threshold, datetime.now().isoformat(timespec='seconds')))
+
+
+def remove_price_alerts(user_id, alert_ids):
+    with transaction() as conn:
+        conn.executemany("DELETE FROM price_alerts WHERE user_id = ? AND id = ?",
+                         [(user_id, alert_id) for alert_id in alert_ids])
+
+
+# ============ CLI ============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate alert rules and deliver queued alerts.")
+    parser.add_argument('--evaluate', action='store_true', help="queue new alerts for all users")
+    parser.add_argument('--drain', action='store_true', help="send queued alerts via SMTP")
+    parser.add_argument('--limit', type=int, help="send at most this many alerts")
+    args = parser.parse_args(argv)
+
+    if not (args.evaluate or args.drain):
+        parser.print_help()
+        return
+    if args.evaluate:
+        queued = evaluate()
+        print(", ".join(f"{name}: {count}" for name, count in queued.items()))
+    if args.drain:
+        print(f"Sent {drain(args.limit):,} alert(s) via {SMTP_HOST}:{SMTP_PORT}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Streaming detection of unusually large expenses.
+
+Each (user, category) keeps an exponentially weighted mean and variance in
+expense_stats. A new expense is scored against them before they absorb it, so
+detection is O(1) per expense however long the history. Single inserts are
+handled by the expenses_anomaly_insert trigger (migration 11); bulk writers
+whose rows bypass it call add_batch() instead. Flagged expenses land in
+expense_anomalies.
+"""
+import numpy as np
+import pandas as pd
+
+from db import connect
+from rollups import CATEGORY_EXPR
+
+# ============ CONFIG ============
+# Must match the expenses_anomaly_insert trigger
+ALPHA = 0.05  # weight of each new expense once warmed up
+MIN_COUNT = 5  # earlier expenses in a category before any are flagged
+Z_THRESHOLD = 3.0  # standard deviations above the mean
+
+
+# ============ STATISTICS ============
+def is_anomaly(amount, count, mean, variance):
+    return count >= MIN_COUNT and variance > 0 and amount > mean and \
+        (amount - mean) ** 2 > Z_THRESHOLD ** 2 * variance
+
+
+def update(amount, count, mean, variance):
+    """Stats after absorbing `amount`; early on this is the plain running mean and variance."""
+    if count == 0:
+        return 1, amount, 0.0
+    weight = max(ALPHA, 1.0 / (count + 1))
+    delta = amount - mean
+    return count + 1, mean + weight * delta, (1 - weight) * (variance + weight * delta * delta)
+
+
+# ============ BATCHED WRITES ============
+def add_batch(conn, user_id, source, params=()):
+    """Score and absorb a batch of new rows (id, date, amount, category), oldest first.
+
+    Runs inside the caller's transaction; `source` is a trusted table name or
+    parenthesised subquery whose placeholders are bound from `params`.
+    """
+    rows = conn.execute(f"""
+        SELECT id, amount, {CATEGORY_EXPR} FROM {source}
+        WHERE date IS NOT NULL AND amount IS NOT NULL
+        ORDER BY date, id
+    """, params).fetchall()
+    if not rows:
+        return 0
+    stats = {category: (count, mean, variance) for category, count, mean, variance in conn.execute(
+        "SELECT category, count, mean, variance FROM expense_stats WHERE user_id = ?", (user_id,))}
+    flagged = []
+    for expense_id, amount, category in rows:
+        count, mean, variance = stats.get(category, (0, 0.0, 0.0))
+        if is_anomaly(amount, count, mean, variance):
+            flagged.append((user_id, expense_id, category, amount, mean, variance))
+        stats[category] = update(amount, count, mean, variance)
+
+    conn.executemany("""
+        INSERT OR IGNORE INTO expense_anomalies (user_id, expense_id, category, amount, expected, variance)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, flagged)
+    touched = {category for _, _, category in rows}
+    conn.executemany("""
+        INSERT INTO expense_stats (user_id, category, count, mean, variance) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, category) DO UPDATE SET
+            count = excluded.count, mean = excluded.mean, variance = excluded.variance
+    """, ((user_id, category) + stats[category] for category in touched))
+    return len(flagged)
+
+
+# ============ QUERIES ============
+def recent(user_id, limit=20):
+    """Latest flagged expenses: date, description, category, amount, expected, score."""
+    with connect() as conn:
+        df = pd.read_sql_query("""
+            SELECT e.date, e.description, a.category, a.amount, a.expected, a.variance
+            FROM expense_anomalies a JOIN expenses e ON e.id = a.expense_id
+            WHERE a.user_id = ?
+            ORDER BY a.id DESC
+            LIMIT ?
+        """, conn, params=(user_id, limit))
+    df['score'] = (df['amount'] - df['expected']) / np.sqrt(df.pop('variance'))
+    return df
@@ -0,0 +1,177 @@
+"""Expense categories predicted from the description and amount.
+
+Descriptions are hashed into a fixed-width sparse feature space, so there is
+no vocabulary to grow or store. Each user has an online logistic model
+(SGDClassifier) that learns from every expense they categorize; it is kept
+sparsified, so its size follows the features the user has actually used.
+Predictions blend it with a global prior trained on everyone's labelled
+expenses, trusting the user's own model more as it sees more labels:
+
+    >>> models = load_models(user_id)
+    >>> categories, confidence = predict(models, descriptions, amounts)
+"""
+import os
+import pickle
+import re
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import streamlit as st
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+from db import connect, transaction
+
+# ============ CONFIG ============
+N_FEATURES = 2 ** 18
+PRIOR_STRENGTH = 20  # labels after which a user's model and the prior weigh equally
+PRIOR_SAMPLE = int(os.environ.get('FINANCE_CATEGORIZER_PRIOR_SAMPLE', '50000'))
+PRIOR_TTL = 24 * 3600  # seconds between global prior retrains
+MIN_CONFIDENCE = float(os.environ.get('FINANCE_CATEGORIZER_MIN_CONFIDENCE', '0.4'))
+
+# Starter examples so the prior can suggest the default categories before anyone has labelled anything
+SEED_EXAMPLES = {
+    'Needs': ('grocery supermarket', 'vegetables milk', 'rent', 'petrol fuel', 'metro bus fare'),
+    'Wants': ('restaurant dinner', 'swiggy zomato food delivery', 'amazon shopping', 'clothes'),
+    'Investment': ('mutual fund sip', 'stocks zerodha', 'ppf deposit', 'fixed deposit'),
+    'Bills': ('electricity bill', 'mobile recharge', 'internet broadband', 'gas cylinder', 'insurance premium'),
+    'Entertainment': ('movie tickets', 'netflix subscription', 'concert', 'spotify'),
+    'Health': ('pharmacy medicines', 'doctor consultation', 'hospital', 'gym membership'),
+}
+
+# user is the user's classifier (None until they have labelled two
+# categories) and labels how many expenses it has learned from; prior is the
+# shared global classifier.
+Models = namedtuple('Models', 'user labels prior')
+
+_vectorizer = HashingVectorizer(n_features=N_FEATURES, alternate_sign=False, ngram_range=(1, 2),
+                                lowercase=False)
+_digits = re.compile(r'\d+')
+
+
+# ============ FEATURES ============
+def features(descriptions, amounts):
+    """Sparse features for parallel sequences of descriptions and amounts.
+
+    Digit runs (reference numbers, dates) collapse to one token, and the
+    amount adds a token for its power-of-two bucket.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        buckets = np.where(amounts > 0, np.floor(np.log2(amounts + 1)), -1).astype(int)
+    texts = [f"{_digits.sub('0', (text or '').lower())} amount{bucket}"
+             for text, bucket in zip(descriptions, buckets.tolist())]
+    return _vectorizer.transform(texts)
+
+
+def _train(descriptions, amounts, categories):
+    if len(set(categories)) < 2:
+        return None
+    model = SGDClassifier(loss='log_loss', alpha=1e-5, random_state=0)
+    model.fit(features(descriptions, amounts), categories)
+    model.sparsify()
+    return model
+
+
+# ============ GLOBAL PRIOR ============
+@st.cache_resource(ttl=PRIOR_TTL, show_spinner=False)
+def global_prior():
+    """Classifier over the seed examples and the most recent labelled expenses of all users."""
+    with connect() as conn:
+        rows = conn.execute("""
+            SELECT description, amount, category FROM expenses
+            WHERE description <> '' AND category <> ''
+            ORDER BY id DESC LIMIT ?
+        """, (PRIOR_SAMPLE,)).fetchall()
+    seeds = [(text, np.nan, category) for category, texts in SEED_EXAMPLES.items() for text in texts]
+    descriptions, amounts, categories = zip(*(seeds + rows))
+    return _train(descriptions, amounts, categories)
+
+
+# ============ PER-USER MODELS ============
+def _labelled_history(user_id):
+    with connect() as conn:
+        rows = conn.execute("""
+            SELECT description, amount, category FROM expenses
+            WHERE user_id = ? AND description <> '' AND category <> ''
+            ORDER BY id
+        """, (user_id,)).fetchall()
+    return tuple(zip(*rows)) if rows else ((), (), ())
+
+
+def _save(user_id, model, labels):
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO category_models (user_id, labels, model, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                labels = excluded.labels, model = excluded.model, updated_at = excluded.updated_at
+        """, (user_id, labels, pickle.dumps(model), datetime.now().isoformat(timespec='seconds')))
+
+
+def load_models(user_id):
+    with connect() as conn:
+        row = conn.execute("SELECT model, labels FROM category_models WHERE user_id = ?",
+                           (user_id,)).fetchone()
+    user, labels = (pickle.loads(row[0]), row[1]) if row else (None, 0)
+    return Models(user, labels, global_prior())
+
+
+def learn(user_id, descriptions, amounts, categories):
+    """Update a user's model with confirmed (or corrected) categories.
+
+    Known categories are a partial_fit step; a category the model has never
+    seen means refitting it from the user's labelled history, which already
+    includes the new expenses.
+    """
+    keep = [i for i, (text, category) in enumerate(zip(descriptions, categories)) if text and category]
+    if not keep:
+        return
+    descriptions, amounts, categories = ([values[i] for i in keep] for values in (descriptions, amounts, categories))
+    models = load_models(user_id)
+    model, labels = models.user, models.labels + len(keep)
+    if model is not None and set(categories) <= set(model.classes_):
+        model.densify()
+        model.partial_fit(features(descriptions, amounts), categories)
+        model.sparsify()
+    else:
+        history = _labelled_history(user_id)
+        model, labels = _train(*history), len(history[0])
+        if model is None:
+            return
+    _save(user_id, model, labels)
+
+
+# ============ PREDICTION ============
+def predict(models, descriptions, amounts):
+    """Most likely category and its probability for every row, in one vectorized pass."""
+    if not len(descriptions):
+        return np.array([], dtype=object), np.array([])
+    X = features(descriptions, amounts)
+    parts = [(model, weight) for model, weight in (
+        (models.user, models.labels / (models.labels + PRIOR_STRENGTH)),
+        (models.prior, PRIOR_STRENGTH / (models.labels + PRIOR_STRENGTH)),
+    ) if model is not None]
+    if not parts:
+        return np.full(len(descriptions), None, dtype=object), np.zeros(len(descriptions))
+    weights = np.array([weight for _, weight in parts])
+    weights /= weights.sum()
+    classes = np.array(sorted(set().union(*(model.classes_ for model, _ in parts))), dtype=object)
+    probabilities = np.zeros((X.shape[0], len(classes)))
+    for (model, _), weight in zip(parts, weights):
+        columns = np.searchsorted(classes, model.classes_)
+        probabilities[:, columns] += weight * model.predict_proba(X)
+    best = probabilities.argmax(axis=1)
+    return classes[best], probabilities[np.arange(len(best)), best]
+
+
+def fill_missing(models, descriptions, amounts, categories, min_confidence=MIN_CONFIDENCE):
+    """`categories` with blanks replaced by confident predictions (others left blank)."""
+    categories = np.array(categories, dtype=object)
+    missing = np.flatnonzero([not category for category in categories])
+    if len(missing):
+        predicted, confidence = predict(models, [descriptions[i] for i in missing],
+                                        np.asarray(amounts, dtype=float)[missing])
+        sure = confidence >= min_confidence
+        categories[missing[sure]] = predicted[sure]
+    return categories
@@ -0,0 +1,84 @@
+"""Chart data preparation.
+
+Long series are downsampled with Largest-Triangle-Three-Buckets (LTTB) before
+they reach Plotly, so the chart payload stays bounded by MAX_POINTS per chart
+while peaks, troughs and the overall shape are kept.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# ============ CONFIG ============
+MAX_POINTS = int(os.environ.get('FINANCE_CHART_MAX_POINTS', '1000'))
+MIN_POINTS = 100  # per-series floor when a chart's budget is split across many series
+
+
+# ============ LTTB ============
+def lttb_indices(x, y, n_out):
+    """Positions of the `n_out` points LTTB keeps from the sorted series (x, y).
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the mean of the next bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bucket edges over the interior points [1, n - 1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Mean of each bucket, computed up front from cumulative sums
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = np.diff(edges)
+    mean_x = (cx[edges[1:]] - cx[edges[:-1]]) / sizes
+    mean_y = (cy[edges[1:]] - cy[edges[:-1]]) / sizes
+    # The bucket after the last interior one is the final point itself
+    mean_x = np.append(mean_x, x[-1])
+    mean_y = np.append(mean_y, y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (mean_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _numeric_x(values):
+    values = pd.Index(values)
+    if isinstance(values, pd.DatetimeIndex):
+        return values.asi8.astype(float)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=float)
+    # Categorical axes such as 'YYYY-MM' labels are evenly spaced
+    return np.arange(len(values), dtype=float)
+
+
+# ============ CHART DATA ============
+def downsample(data, y, x=None, max_points=MAX_POINTS):
+    """Rows of `data` to plot for column `y` against column `x` (default: the index).
+
+    Returned unchanged at or below `max_points` rows. Rows with a missing `y`
+    are dropped before downsampling since they cannot be drawn anyway.
+    """
+    if len(data) <= max_points:
+        return data
+    data = data[data[y].notna()]
+    if len(data) <= max_points:
+        return data
+    xs = _numeric_x(data.index if x is None else data[x])
+    return data.iloc[lttb_indices(xs, data[y].to_numpy(dtype=float), max_points)]
+
+
+def series_budget(n_series, max_points=MAX_POINTS):
+    """Points per series when `n_series` traces share one chart's budget."""
+    return max(MIN_POINTS, max_points // max(1, n_series))
@@ -0,0 +1,132 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import streamlit as st
+
+from migrations import migrate
+
+# ============ CONFIG ============
+DB_PATH = os.environ.get('FINANCE_DB_PATH', 'finance_tracker.db')
+POOL_SIZE = int(os.environ.get('FINANCE_DB_POOL_SIZE', '8'))
+BUSY_TIMEOUT_MS = 5000
+ACQUIRE_TIMEOUT = float(os.environ.get('FINANCE_DB_ACQUIRE_SECONDS', '30'))
+
+# Applied to every pooled connection. WAL lets readers run alongside the
+# single writer, and NORMAL sync is durable enough in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",       # 64 MiB page cache per connection
+    "PRAGMA mmap_size=268435456",     # 256 MiB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+# ============ CONNECTION POOL ============
+class PoolExhausted(RuntimeError):
+    pass
+
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived SQLite connections shared by all sessions.
+
+    Connections stay open for the life of the process so SQLite's per-connection
+    prepared statement cache survives across Streamlit reruns.
+    """
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            isolation_level=None,     # transactions are opened explicitly
+            cached_statements=256,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        """Borrow a connection, waiting at most `timeout` seconds for one to be released."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolExhausted(
+                f"No database connection became free within {timeout:g}s; all {self.size} "
+                "pooled connections are in use (raise FINANCE_DB_POOL_SIZE or look for a leaked "
+                "connection).") from None
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+@st.cache_resource
+def get_pool():
+    """Process-wide pool; schema migrations run once, when it is first created."""
+    pool = ConnectionPool(DB_PATH, POOL_SIZE)
+    with pool.connection() as conn:
+        migrate(conn)
+    return pool
+
+
+# ============ ACCESS HELPERS ============
+@contextmanager
+def connect():
+    """Borrow a pooled connection (autocommit) for reads."""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+@contextmanager
+def transaction():
+    """Borrow a pooled connection inside a write transaction.
+
+    BEGIN IMMEDIATE takes the write lock up front so concurrent writers queue on
+    busy_timeout instead of failing with 'database is locked' on lock upgrade.
+    """
+    with get_pool().connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
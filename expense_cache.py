@@ -0,0 +1,165 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from db import connect
+
+# ============ CONFIG ============
+CACHE_BUDGET_MB = int(os.environ.get('FINANCE_EXPENSE_CACHE_MB', '256'))
+EPOCH = np.datetime64('1970-01-01', 'D')
+WEEKDAYS = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+
+
+# ============ COMPACT ENTRY ============
+class UserExpenses:
+    """One user's expenses as parallel NumPy columns, sorted by (date, id).
+
+    Dates are int32 day numbers since 1970-01-01 and categories are int16 codes
+    into `categories`. Descriptions are only read from SQLite when first asked for.
+    """
+
+    __slots__ = ('user_id', 'version', 'ids', 'days', 'amounts', 'codes',
+                 'categories', '_descriptions')
+
+    def __init__(self, user_id, version, ids, days, amounts, codes, categories):
+        self.user_id = user_id
+        self.version = version
+        self.ids = ids
+        self.days = days
+        self.amounts = amounts
+        self.codes = codes
+        self.categories = categories
+        self._descriptions = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        size = self.ids.nbytes + self.days.nbytes + self.amounts.nbytes + self.codes.nbytes
+        size += sum(len(c) for c in self.categories) + 64 * len(self.categories)
+        if self._descriptions is not None:
+            size += sum(len(d) for d in self._descriptions if d) + 8 * len(self._descriptions)
+        return size
+
+    @property
+    def dates(self):
+        return EPOCH + self.days.astype('timedelta64[D]')
+
+    @property
+    def descriptions(self):
+        if self._descriptions is None:
+            with connect() as conn:
+                rows = conn.execute("SELECT id, description FROM expenses WHERE user_id = ?",
+                                    (self.user_id,)).fetchall()
+            lookup = dict(rows)
+            self._descriptions = np.array([lookup.get(i) for i in self.ids.tolist()], dtype=object)
+        return self._descriptions
+
+    def weekday_means(self):
+        """Average expense amount per weekday, Monday first, like rollups.weekday_means()."""
+        weekdays = (self.days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        counts = np.bincount(weekdays, minlength=7)
+        totals = np.bincount(weekdays, weights=np.nan_to_num(self.amounts), minlength=7)
+        present = counts > 0
+        return pd.Series(totals[present] / counts[present], index=WEEKDAYS[present])
+
+    def to_frame(self, with_description=False):
+        frame = pd.DataFrame({
+            'date': self.dates,
+            'amount': self.amounts,
+            'category': pd.Categorical.from_codes(self.codes, categories=self.categories),
+        })
+        if with_description:
+            frame['description'] = self.descriptions
+        return frame
+
+
+def _load(conn, user_id):
+    # Read the version and the rows from one snapshot so they always agree
+    conn.execute("BEGIN")
+    try:
+        row = conn.execute("SELECT data_version FROM users WHERE id = ?", (user_id,)).fetchone()
+        rows = conn.execute("""
+            SELECT id, date, amount, COALESCE(NULLIF(category, ''), 'Uncategorized')
+            FROM expenses
+            WHERE user_id = ? AND date IS NOT NULL
+            ORDER BY date, id
+        """, (user_id,)).fetchall()
+    finally:
+        conn.commit()
+
+    version = row[0] if row else 0
+    if not rows:
+        return UserExpenses(user_id, version, np.empty(0, np.int64), np.empty(0, np.int32),
+                            np.empty(0, np.float64), np.empty(0, np.int16), [])
+    ids, dates, amounts, categories = zip(*rows)
+    codes, uniques = pd.factorize(pd.Series(categories), sort=True)
+    return UserExpenses(
+        user_id,
+        version,
+        np.fromiter(ids, np.int64, len(ids)),
+        (np.array(dates, dtype='datetime64[D]') - EPOCH).astype(np.int32),
+        np.array(amounts, dtype=np.float64),
+        codes.astype(np.int16 if len(uniques) < 2 ** 15 else np.int32),
+        list(uniques),
+    )
+
+
+# ============ PROCESS-WIDE CACHE ============
+class ExpenseCache:
+    """LRU of UserExpenses entries bounded by an approximate byte budget."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with connect() as conn:
+            row = conn.execute("SELECT data_version FROM users WHERE id = ?", (user_id,)).fetchone()
+            version = row[0] if row else 0
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None and entry.version == version:
+                    self._entries.move_to_end(user_id)
+                    return entry
+            entry = _load(conn, user_id)
+
+        with self._lock:
+            current = self._entries.get(user_id)
+            if current is None or current.version <= entry.version:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+            self._evict()
+        return entry
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values())
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it alone exceeds the budget
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            total -= evicted.nbytes
+
+
+@st.cache_resource
+def get_expense_cache():
+    return ExpenseCache(CACHE_BUDGET_MB * 1024 * 1024)
+
+
+def user_expenses(user_id):
+    """Cached compact expenses for a user, reloaded only when their data version changes."""
+    return get_expense_cache().get(user_id)
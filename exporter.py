@@ -0,0 +1,192 @@
+"""Chunked, streaming export of a user's data.
+
+Rows are pulled from a SQLite cursor in fixed-size chunks and written straight
+to the output file, so peak memory depends on CHUNK_SIZE, not on how much
+history the user has. New tables become exportable by adding them to EXPORTS.
+
+    python exporter.py expenses --user-id 1 --format jsonl -o expenses.jsonl
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import tempfile
+from collections import namedtuple
+
+from db import connect
+
+# ============ CONFIG ============
+CHUNK_SIZE = 10000
+
+# sql must select exactly `columns`, filtered by a single user_id placeholder.
+# Column types are used for the Parquet schema: 'string', 'float64' or 'int64'.
+ExportSpec = namedtuple('ExportSpec', 'sql columns')
+
+EXPORTS = {
+    'expenses': ExportSpec(
+        """SELECT date, amount, category, description
+           FROM expenses WHERE user_id = ? ORDER BY date, id""",
+        (('date', 'string'), ('amount', 'float64'), ('category', 'string'), ('description', 'string')),
+    ),
+    'goals': ExportSpec(
+        """SELECT name, target_amount, current_amount, target_date, priority
+           FROM goals WHERE user_id = ? ORDER BY target_date, id""",
+        (('name', 'string'), ('target_amount', 'float64'), ('current_amount', 'float64'),
+         ('target_date', 'string'), ('priority', 'string')),
+    ),
+    'watchlist': ExportSpec(
+        """SELECT symbol, added_at
+           FROM watchlists WHERE user_id = ? ORDER BY added_at, symbol""",
+        (('symbol', 'string'), ('added_at', 'string')),
+    ),
+    'transactions': ExportSpec(
+        """SELECT t.date, h.symbol, h.asset_class, t.quantity, t.price, t.fees
+           FROM transactions t JOIN holdings h ON h.id = t.holding_id
+           WHERE t.user_id = ? ORDER BY t.date, t.id""",
+        (('date', 'string'), ('symbol', 'string'), ('asset_class', 'string'), ('quantity', 'float64'),
+         ('price', 'float64'), ('fees', 'float64')),
+    ),
+    'budgets': ExportSpec(
+        """SELECT category, monthly_limit
+           FROM budgets WHERE user_id = ? ORDER BY category""",
+        (('category', 'string'), ('monthly_limit', 'float64')),
+    ),
+    'price_alerts': ExportSpec(
+        """SELECT symbol, direction, threshold, created_at, triggered_at, triggered_price
+           FROM price_alerts WHERE user_id = ? ORDER BY created_at, id""",
+        (('symbol', 'string'), ('direction', 'string'), ('threshold', 'float64'), ('created_at', 'string'),
+         ('triggered_at', 'string'), ('triggered_price', 'float64')),
+    ),
+}
+
+# format -> (file extension, MIME type)
+FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+# ============ READING ============
+def iter_chunks(table, user_id, chunk_size=CHUNK_SIZE):
+    """Yield lists of row tuples for one user's table, at most chunk_size at a time."""
+    spec = EXPORTS[table]
+    with connect() as conn:
+        cursor = conn.execute(spec.sql, (user_id,))
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+
+# ============ WRITERS ============
+def _write_csv(out, names, chunks):
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    try:
+        writer = csv.writer(text)
+        writer.writerow(names)
+        for rows in chunks:
+            writer.writerows(rows)
+        text.flush()
+    finally:
+        text.detach()
+
+
+def _write_csv_gz(out, names, chunks):
+    with gzip.GzipFile(fileobj=out, mode='wb') as gz:
+        _write_csv(gz, names, chunks)
+
+
+def _write_jsonl(out, names, chunks):
+    for rows in chunks:
+        out.write(''.join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n'
+                          for row in rows).encode('utf-8'))
+
+
+def _write_parquet(out, columns, chunks):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)") from e
+
+    types = {'string': pa.string(), 'float64': pa.float64(), 'int64': pa.int64()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in chunks:
+            # One row group per chunk
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def write_export(out, table, user_id, fmt, chunk_size=CHUNK_SIZE):
+    """Stream one user's table to the binary file object `out` in the given format."""
+    if table not in EXPORTS:
+        raise ValueError(f"Unknown export {table!r}; expected one of {', '.join(EXPORTS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+    columns = EXPORTS[table].columns
+    names = [name for name, _ in columns]
+    chunks = iter_chunks(table, user_id, chunk_size)
+    if fmt == 'csv':
+        _write_csv(out, names, chunks)
+    elif fmt == 'csv.gz':
+        _write_csv_gz(out, names, chunks)
+    elif fmt == 'jsonl':
+        _write_jsonl(out, names, chunks)
+    else:
+        _write_parquet(out, columns, chunks)
+
+
+def export_to_tempfile(table, user_id, fmt, chunk_size=CHUNK_SIZE):
+    """Write an export to an anonymous temp file on disk and return it rewound."""
+    out = tempfile.TemporaryFile()
+    try:
+        write_export(out, table, user_id, fmt, chunk_size)
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+
+def export_bytes(table, user_id, fmt, chunk_size=CHUNK_SIZE):
+    """The finished export as bytes, for Streamlit's download button.
+
+    Rows are still read and encoded chunk by chunk, but Streamlit keeps
+    download data in memory, so the whole file is held once here. Use the
+    command line for exports too large for that.
+    """
+    with export_to_tempfile(table, user_id, fmt, chunk_size) as out:
+        return out.read()
+
+
+def file_name(table, fmt):
+    return f"my_{table}.{FORMATS[fmt][0]}"
+
+
+# ============ CLI ============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a user's data.")
+    parser.add_argument('table', choices=sorted(EXPORTS))
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('-o', '--output', help="output path (default: my_<table>.<ext>)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    path = args.output or file_name(args.table, args.format)
+    with open(path, 'wb') as out:
+        write_export(out, args.table, args.user_id, args.format, args.chunk_size)
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
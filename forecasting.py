@@ -0,0 +1,238 @@
+"""Expense forecasts for the coming months, overall and per category.
+
+Every series (each category plus the total) gets a damped-trend exponential
+smoothing model over complete calendar months. All series run under a grid of
+smoothing parameters at once, and each series forecasts with the parameters
+that had the lowest one-step error so far. Because the smoothing state only
+depends on months already seen, a model is brought up to date by folding in
+the newly completed months; only a change to an earlier month forces a refit.
+Models are stored per user and keyed by data version:
+
+    >>> model = get_model(user_id)
+    >>> forecast(model)          # categories x next months
+
+`python forecasting.py --refit` refits every user from scratch in parallel.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import rollups
+from db import connect, transaction
+
+# ============ CONFIG ============
+ALPHAS = (0.1, 0.2, 0.3, 0.5, 0.7, 0.9)  # level smoothing
+BETAS = (0.0, 0.1, 0.3)  # trend smoothing
+DAMPING = 0.9  # trend decay per month ahead
+MIN_MONTHS = 3  # complete months needed before forecasting
+REFIT_WORKERS = int(os.environ.get('FINANCE_FORECAST_WORKERS', str(os.cpu_count() or 1)))
+TOTAL = 'Total'
+
+_alpha, _beta = np.meshgrid(ALPHAS, BETAS, indexing='ij')
+ALPHA, BETA = _alpha.reshape(-1, 1), _beta.reshape(-1, 1)  # one row per parameter pair
+
+# history is the (month x column) matrix folded in so far, starting at
+# first_month; columns are the categories then TOTAL. level, trend and sse
+# are (parameter pair x column). as_of is the calendar month the model was
+# last updated in.
+Model = namedtuple('Model', 'version as_of first_month columns history level trend sse')
+
+
+# ============ SERIES ============
+def _this_month(today=None):
+    return np.datetime64(pd.Timestamp(today or datetime.now()).strftime('%Y-%m'), 'M')
+
+
+def monthly_matrix(category_monthly, today=None):
+    """Complete months of a rollups.category_monthly() frame.
+
+    Returns (first month, columns, matrix). Rows run from the first month
+    with spending to the month before `today`, with zeros for months without
+    spending (including any run of empty months at the end); the last column
+    is the total.
+    """
+    months = np.asarray(category_monthly['month'], dtype='datetime64[M]')
+    last = _this_month(today) - 1
+    complete = months <= last
+    if not complete.any():
+        return None, (TOTAL,), np.zeros((0, 1))
+    months = months[complete]
+    codes, categories = pd.factorize(category_monthly['category'].to_numpy()[complete], sort=True)
+    first = months.min()
+    matrix = np.zeros(((last - first).astype(int) + 1, len(categories) + 1))
+    np.add.at(matrix, ((months - first).astype(int), codes),
+              category_monthly['amount'].to_numpy(dtype=float)[complete])
+    matrix[:, -1] = matrix[:, :-1].sum(axis=1)
+    return first, tuple(categories) + (TOTAL,), matrix
+
+
+# ============ MODEL ============
+def _smooth(level, trend, sse, observations):
+    for observed in observations:
+        predicted = level + DAMPING * trend
+        error = observed - predicted
+        sse = sse + error ** 2
+        level = predicted + ALPHA * error
+        trend = DAMPING * trend + ALPHA * BETA * error
+    return level, trend, sse
+
+
+def fit(version, first, columns, matrix, today=None):
+    """Model for a monthly_matrix() from scratch."""
+    shape = (len(ALPHA), matrix.shape[1])
+    level = np.broadcast_to(matrix[0], shape).copy()
+    level, trend, sse = _smooth(level, np.zeros(shape), np.zeros(shape), matrix[1:])
+    return Model(version, _this_month(today), first, columns, matrix, level, trend, sse)
+
+
+def update(model, version, first, columns, matrix, today=None):
+    """Bring `model` up to date with a newer monthly_matrix().
+
+    Only the months the model has not seen are folded in; if any month it
+    has seen changed, it is refit.
+    """
+    seen = len(model.history)
+    if (first != model.first_month or columns != model.columns or len(matrix) < seen
+            or not np.allclose(matrix[:seen], model.history)):
+        return fit(version, first, columns, matrix, today)
+    level, trend, sse = _smooth(model.level, model.trend, model.sse, matrix[seen:])
+    return Model(version, _this_month(today), first, columns, matrix, level, trend, sse)
+
+
+def forecast(model, horizon=2):
+    """Forecast spend for the `horizon` months after the model's last month.
+
+    Returns a DataFrame indexed by category (then TOTAL) with one column per
+    'YYYY-MM' month. TOTAL is the sum of the category forecasts, so the two
+    views always agree.
+    """
+    best = np.argmin(model.sse, axis=0)
+    columns = np.arange(len(model.columns))
+    level, trend = model.level[best, columns], model.trend[best, columns]
+    steps = np.cumsum(DAMPING ** np.arange(1, horizon + 1))
+    values = np.maximum(level + steps[:, None] * trend, 0.0)
+    if len(model.columns) > 1:
+        values[:, -1] = values[:, :-1].sum(axis=1)
+    months = model.first_month + len(model.history) + np.arange(horizon)
+    return pd.DataFrame(values.T, index=pd.Index(model.columns, name='category'),
+                        columns=[str(month) for month in months])
+
+
+# ============ STORAGE ============
+def dumps(model):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, version=model.version, as_of=str(model.as_of),
+                        first_month=str(model.first_month), columns=np.array(model.columns, dtype=str),
+                        history=model.history, level=model.level, trend=model.trend, sse=model.sse)
+    return buffer.getvalue()
+
+
+def loads(blob):
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        return Model(int(data['version']), np.datetime64(str(data['as_of']), 'M'),
+                     np.datetime64(str(data['first_month']), 'M'), tuple(data['columns'].tolist()),
+                     data['history'], data['level'], data['trend'], data['sse'])
+
+
+def _data_version(conn, user_id):
+    row = conn.execute("SELECT data_version FROM users WHERE id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def save_model(user_id, model):
+    with transaction() as conn:
+        # A slower writer holding an older version must not overwrite a newer model
+        conn.execute("""
+            INSERT INTO forecast_models (user_id, data_version, model, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                data_version = excluded.data_version,
+                model = excluded.model,
+                updated_at = excluded.updated_at
+            WHERE excluded.data_version >= forecast_models.data_version
+        """, (user_id, model.version, dumps(model), datetime.now().isoformat(timespec='seconds')))
+
+
+def _refit(user_id, model=None, today=None):
+    with connect() as conn:
+        # Read the version before the data, so a concurrent change leaves the
+        # model marked stale rather than current
+        version = _data_version(conn, user_id)
+    first, columns, matrix = monthly_matrix(rollups.category_monthly(user_id), today)
+    if not len(matrix):
+        return None
+    if model is None:
+        model = fit(version, first, columns, matrix, today)
+    else:
+        model = update(model, version, first, columns, matrix, today)
+    save_model(user_id, model)
+    return model
+
+
+def get_model(user_id, today=None):
+    """A user's model, updated only when their data or the calendar month changed.
+
+    None until the user has MIN_MONTHS complete months of expenses.
+    """
+    with connect() as conn:
+        version = _data_version(conn, user_id)
+        row = conn.execute("SELECT model FROM forecast_models WHERE user_id = ?", (user_id,)).fetchone()
+    model = loads(row[0]) if row else None
+    if model is not None and model.level.shape[0] != len(ALPHA):
+        model = None  # stored under a different parameter grid
+    # A model whose history stops short of last month predates zero-filled
+    # trailing months and is brought up to date like a stale one
+    if (model is None or model.version != version or model.as_of != _this_month(today)
+            or model.first_month + len(model.history) != _this_month(today)):
+        model = _refit(user_id, model, today)
+    if model is None or len(model.history) < MIN_MONTHS:
+        return None
+    return model
+
+
+# ============ BATCH REFIT ============
+def _refit_users(user_ids):
+    for user_id in user_ids:
+        _refit(user_id)
+    return len(user_ids)
+
+
+def refit_all(user_ids=None, workers=REFIT_WORKERS):
+    """Refit models from scratch for `user_ids` (default all users); returns the count."""
+    if user_ids is None:
+        with connect() as conn:
+            user_ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+    if workers <= 1 or len(user_ids) <= 1:
+        return _refit_users(user_ids)
+    chunks = [chunk.tolist() for chunk in np.array_split(np.asarray(user_ids), workers) if len(chunk)]
+    # Fresh interpreters, so no worker inherits the parent's pooled SQLite connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=len(chunks), mp_context=context) as pool:
+        return sum(pool.map(_refit_users, chunks))
+
+
+# ============ CLI ============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain cached expense forecasting models.")
+    parser.add_argument('--refit', action='store_true', help="refit models from scratch")
+    parser.add_argument('--user-id', type=int, help="limit the refit to one user")
+    parser.add_argument('--workers', type=int, default=REFIT_WORKERS, help="parallel worker processes")
+    args = parser.parse_args(argv)
+
+    if not args.refit:
+        parser.print_help()
+        return
+    user_ids = [args.user_id] if args.user_id is not None else None
+    count = refit_all(user_ids, args.workers)
+    print(f"Refit forecasting models for {count} user(s).")
+
+
+if __name__ == "__main__":
+    main()
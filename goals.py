@@ -0,0 +1,121 @@
+"""Goal planning.
+
+Every function works on whole arrays of goals at once. Contributions are made
+at the end of each month and earn `annual_return` compounded monthly; money
+already saved towards a goal earns the same return.
+"""
+import numpy as np
+import pandas as pd
+
+from db import connect
+
+# ============ CONFIG ============
+PRIORITIES = ('High', 'Medium', 'Low')  # funded in this order
+DAYS_PER_MONTH = 365.25 / 12
+
+
+# ============ ANNUITY MATH ============
+def months_until(target_dates, today=None):
+    """Fractional months from `today` to each target date (negative once passed)."""
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    delta = pd.DatetimeIndex(pd.to_datetime(target_dates)) - today
+    return delta.days.to_numpy(dtype=float) / DAYS_PER_MONTH
+
+
+def required_monthly(target, current, annual_return, months):
+    """Monthly contribution that grows `current` into `target` within `months`.
+
+    Goals already covered by the growth of `current` need 0; goals whose date
+    has passed get NaN.
+    """
+    target, current, months = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+                                                    for a in (target, current, months)))
+    rate = annual_return / 1200
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + rate) ** months
+        shortfall = np.maximum(target - current * growth, 0.0)
+        if rate:
+            payment = shortfall * rate / (growth - 1)
+        else:
+            payment = shortfall / months
+    payment = np.where(shortfall == 0, 0.0, payment)
+    return np.where(months > 0, payment, np.nan)
+
+
+def months_to_reach(target, current, annual_return, monthly):
+    """Months until `current` plus `monthly` contributions reach `target` (inf if never)."""
+    target, current, monthly = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+                                                     for a in (target, current, monthly)))
+    rate = annual_return / 1200
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if rate:
+            # target = current * g + monthly * (g - 1) / rate, solved for g = (1 + rate) ** n
+            growth = (target * rate + monthly) / (current * rate + monthly)
+            months = np.log(growth) / np.log1p(rate)
+        else:
+            months = (target - current) / monthly
+    months = np.where(np.isnan(months) | (months < 0), np.inf, months)
+    return np.where(current >= target, 0.0, months)
+
+
+# ============ BUDGETING ============
+def allocate_budget(required, priority, months, budget):
+    """Split a monthly `budget` across goals, fully funding them in priority order.
+
+    Within a priority, goals due sooner are funded first; the first goal the
+    budget cannot cover gets the remainder and the rest get nothing.
+    """
+    required = np.nan_to_num(np.asarray(required, dtype=float))
+    rank = pd.Categorical(priority, categories=PRIORITIES, ordered=True).codes
+    rank = np.where(rank < 0, len(PRIORITIES), rank)  # unknown priorities go last
+    order = np.lexsort((np.asarray(months, dtype=float), rank))
+    funded_before = np.cumsum(required[order]) - required[order]
+    allocation = np.empty_like(required)
+    allocation[order] = np.clip(budget - funded_before, 0.0, required[order])
+    return allocation
+
+
+# ============ PLANNING ============
+def plan(goals, annual_return, budget=None, today=None):
+    """Feasibility table for a user's goals.
+
+    `goals` needs name, target_amount, current_amount, target_date and
+    priority columns. With a `budget` the projected completion dates assume
+    each goal receives its allocate_budget() share; otherwise the monthly
+    amount needed.
+    """
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    target = goals['target_amount'].to_numpy(dtype=float)
+    current = goals['current_amount'].to_numpy(dtype=float)
+    months = months_until(goals['target_date'], today)
+    needed = required_monthly(target, current, annual_return, months)
+
+    table = pd.DataFrame({
+        'Goal': goals['name'].to_numpy(),
+        'Priority': goals['priority'].to_numpy(),
+        'Target': target,
+        'Saved': current,
+        'Progress': np.clip(np.divide(current, target, out=np.zeros_like(target), where=target > 0), 0, 1),
+        'Target Date': pd.to_datetime(goals['target_date']).to_numpy(),
+        'Monthly Needed': needed,
+    })
+    contribution = needed
+    if budget is not None:
+        contribution = allocate_budget(needed, table['Priority'], months, budget)
+        table['Allocated'] = contribution
+    eta = months_to_reach(target, current, annual_return, np.nan_to_num(contribution))
+    finite = np.isfinite(eta)
+    offsets = pd.to_timedelta(np.where(finite, eta, 0) * DAYS_PER_MONTH, unit='D')
+    table['Projected Completion'] = (today + offsets).round('D').where(finite)
+    table['On Track'] = finite & (table['Projected Completion'] <= table['Target Date'])
+    return table
+
+
+def load_goals(user_id):
+    with connect() as conn:
+        return pd.read_sql_query("""
+            SELECT name, target_amount, current_amount, target_date, priority
+            FROM goals
+            WHERE user_id = ?
+            ORDER BY target_date, id
+        """, conn, params=(user_id,))
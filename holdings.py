@@ -0,0 +1,53 @@
+"""Per-user investment ledger: holdings and their buy/sell transactions."""
+import pandas as pd
+
+from db import connect, transaction
+
+ASSET_CLASSES = ('Equity', 'Debt', 'Gold', 'Cash', 'Other')
+
+
+class LedgerError(ValueError):
+    pass
+
+
+def record_transaction(user_id, symbol, asset_class, date, quantity, price, fees=0.0):
+    """Add a buy (quantity > 0) or sell (quantity < 0), creating the holding if needed."""
+    symbol = symbol.strip().upper()
+    if not symbol:
+        raise LedgerError("Enter a symbol.")
+    if quantity == 0 or price <= 0 or fees < 0:
+        raise LedgerError("Quantity must be non-zero, price positive and fees not negative.")
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO holdings (user_id, symbol, asset_class) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, symbol) DO NOTHING
+        """, (user_id, symbol, asset_class))
+        holding_id, = conn.execute("SELECT id FROM holdings WHERE user_id = ? AND symbol = ?",
+                                   (user_id, symbol)).fetchone()
+        conn.execute("""
+            INSERT INTO transactions (user_id, holding_id, date, quantity, price, fees)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user_id, holding_id, str(date), quantity, price, fees))
+        if quantity < 0:
+            # A sell must not take the position negative at any point, including
+            # against sells already recorded after `date`
+            lowest, = conn.execute("""
+                SELECT MIN(position) FROM (
+                    SELECT SUM(quantity) OVER (ORDER BY date, id) AS position
+                    FROM transactions WHERE holding_id = ?)
+            """, (holding_id,)).fetchone()
+            if lowest < -1e-9:
+                raise LedgerError(f"Cannot sell {-quantity:g} {symbol} on {date}; not enough units held.")
+
+
+def load_transactions(user_id):
+    """All of a user's transactions, oldest first: date (datetime64), symbol, asset_class, quantity, price, fees."""
+    with connect() as conn:
+        df = pd.read_sql_query("""
+            SELECT t.date, h.symbol, h.asset_class, t.quantity, t.price, t.fees
+            FROM transactions t JOIN holdings h ON h.id = t.holding_id
+            WHERE t.user_id = ?
+            ORDER BY t.date, t.id
+        """, conn, params=(user_id,))
+    df['date'] = pd.to_datetime(df['date'])
+    return df
@@ -0,0 +1,323 @@
+"""Streaming bank statement import (CSV, OFX/QFX, QIF) into the expenses table.
+
+Statements are parsed as a stream and written in large batches. Each batch is
+inserted with executemany, de-duplicated against earlier imports by a content
+hash, and folded into the rollups and data version in the same transaction.
+Rows without a category get one from the user's categorizer, a batch at a time.
+
+    python importer.py statement.ofx --user-id 1
+
+Sign conventions: OFX and QIF amounts are signed and only debits (negative
+amounts) are imported. CSV files with a debit/withdrawal column import the
+debit rows; otherwise the amount column is taken as the spend, unless
+--signed is given, in which case negative amounts are the debits.
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+from collections import Counter, OrderedDict, namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+import anomalies
+import categorizer
+import rollups
+from db import connect, transaction
+
+# ============ CONFIG ============
+BATCH_SIZE = 50000
+RECENT_DATES = 32  # dates whose duplicate counts are kept while hashing a file
+FORMATS = ('csv', 'ofx', 'qif')
+EXTENSIONS = {'.csv': 'csv', '.ofx': 'ofx', '.qfx': 'ofx', '.qif': 'qif'}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%m/%d/%Y', '%Y/%m/%d',
+                '%d %b %Y', '%d-%b-%Y', '%d-%b-%y', '%d/%m/%y', '%m/%d/%y', '%Y%m%d')
+
+# One parsed statement line; amount is the positive spend
+Transaction = namedtuple('Transaction', 'date amount category description ref')
+ImportProgress = namedtuple('ImportProgress', 'rows_read inserted duplicates bytes_read total_bytes')
+
+
+class StatementError(ValueError):
+    pass
+
+
+# ============ FIELD PARSING ============
+@lru_cache(maxsize=8192)
+def parse_date(value):
+    """Normalise a statement date to YYYY-MM-DD (memoised: statements repeat dates)."""
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise StatementError(f"Unrecognised date: {value!r}")
+
+
+def parse_amount(value):
+    value = value.strip().replace(',', '').replace('₹', '').replace('$', '').replace(' ', '')
+    if not value:
+        return None
+    if value.startswith('(') and value.endswith(')'):
+        value = '-' + value[1:-1]
+    return float(value)
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in EXTENSIONS:
+        raise StatementError(f"Unsupported statement type {ext!r}; expected one of {', '.join(EXTENSIONS)}")
+    return EXTENSIONS[ext]
+
+
+# ============ PARSERS ============
+def _column(header, *names):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def parse_csv(text, signed=False):
+    reader = csv.reader(text)
+    header = [name.strip().lower() for name in next(reader, [])]
+    # Resolve columns once from the header rather than per row
+    date_col = _column(header, 'date', 'transaction date', 'txn date', 'posting date', 'value date')
+    debit_col = _column(header, 'debit', 'withdrawal', 'withdrawal amount')
+    amount_col = debit_col if debit_col is not None else _column(header, 'amount')
+    category_col = _column(header, 'category')
+    description_col = _column(header, 'description', 'narration', 'details', 'particulars', 'memo', 'payee')
+    ref_col = _column(header, 'reference', 'ref', 'transaction id', 'id')
+    if date_col is None or amount_col is None:
+        raise StatementError("CSV statements need a date column and an amount or debit column")
+    width = len(header)
+
+    for row in reader:
+        if len(row) < width or not row[date_col]:
+            continue
+        amount = parse_amount(row[amount_col])
+        if not amount:
+            continue
+        if debit_col is not None:
+            amount = abs(amount)
+        elif signed:
+            if amount > 0:
+                continue
+            amount = -amount
+        elif amount < 0:
+            continue
+        yield Transaction(
+            parse_date(row[date_col]),
+            amount,
+            row[category_col] or None if category_col is not None else None,
+            row[description_col] if description_col is not None else '',
+            row[ref_col] or None if ref_col is not None else None,
+        )
+
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def _ofx_tags(text, chunk_size=1 << 16):
+    # OFX 1.x is SGML (closing tags optional), 2.x is XML; tokenise both the
+    # same way, chunk by chunk, carrying any partial tag over to the next chunk.
+    buffer = ''
+    while True:
+        chunk = text.read(chunk_size)
+        buffer += chunk
+        cut = buffer.rfind('<') if chunk else len(buffer)
+        for match in _OFX_TAG.finditer(buffer, 0, cut):
+            yield match.group(1) == '/', match.group(2).upper(), match.group(3).strip()
+        if not chunk:
+            return
+        buffer = buffer[cut:]
+
+
+def parse_ofx(text, signed=True):
+    fields = None
+    for closing, tag, value in _ofx_tags(text):
+        if tag == 'STMTTRN':
+            if not closing:
+                fields = {}
+                continue
+            if fields and 'DTPOSTED' in fields and 'TRNAMT' in fields:
+                amount = parse_amount(fields['TRNAMT'])
+                if amount is not None and amount < 0:
+                    description = ' '.join(filter(None, (fields.get('NAME'), fields.get('MEMO'))))
+                    yield Transaction(parse_date(fields['DTPOSTED'][:8]), -amount, None,
+                                      description, fields.get('FITID'))
+            fields = None
+        elif fields is not None and not closing and value:
+            fields[tag] = value
+
+
+def parse_qif(text, signed=True):
+    fields = {}
+    for line in text:
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('!'):
+            continue
+        code, value = line[0], line[1:].strip()
+        if code != '^':
+            fields.setdefault(code, value)
+            continue
+        amount = parse_amount(fields.get('T') or fields.get('U') or '')
+        if 'D' in fields and amount is not None and amount < 0:
+            # QIF writes two-digit years after an apostrophe, e.g. 12/31'24
+            date = fields['D'].replace(' ', '').replace("'", '/20')
+            description = ' '.join(filter(None, (fields.get('P'), fields.get('M'))))
+            yield Transaction(parse_date(date), -amount, fields.get('L') or None,
+                              description, fields.get('N'))
+        fields = {}
+
+
+PARSERS = {'csv': parse_csv, 'ofx': parse_ofx, 'qif': parse_qif}
+
+
+# ============ DE-DUPLICATION ============
+def with_hashes(transactions):
+    """Attach a signed 64-bit content hash to each transaction.
+
+    Bank references are used when present. Otherwise the hash covers date, amount
+    and description plus the occurrence number within the file, so two identical
+    coffees on one day survive while re-importing the same statement is a no-op.
+    """
+    # Occurrences are counted per date, keeping only the RECENT_DATES most
+    # recently seen dates, so memory follows the busiest few days rather than
+    # the file. Date-ordered and locally shuffled statements number rows
+    # exactly as a whole-file count would. A date that comes back after its
+    # counts were dropped numbers its rows again with a revisit suffix, so they
+    # cannot collide with the earlier ones.
+    recent = OrderedDict()  # date -> Counter of keys, least recently seen first
+    dropped = Counter()  # date -> times its counts were dropped
+    for txn in transactions:
+        if txn.ref:
+            key = f"ref|{txn.ref}"
+        else:
+            counts = recent.get(txn.date)
+            if counts is None:
+                counts = recent[txn.date] = Counter()
+                if len(recent) > RECENT_DATES:
+                    dropped[recent.popitem(last=False)[0]] += 1
+            else:
+                recent.move_to_end(txn.date)
+            key = f"{txn.date}|{txn.amount:.2f}|{txn.description.strip().lower()}"
+            counts[key] += 1
+            key = f"{key}|{counts[key]}"
+            if txn.date in dropped:
+                key = f"{key}|r{dropped[txn.date]}"
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        yield int.from_bytes(digest, 'big', signed=True), txn
+
+
+# ============ BATCHED WRITES ============
+def _categorize(user_id, models, batch):
+    """Fill in missing categories for a batch with one categorizer call.
+
+    Rows already imported are left alone; INSERT OR IGNORE will skip them.
+    """
+    blank = [i for i, row in enumerate(batch) if not row[3]]
+    if not blank:
+        return batch
+    with connect() as conn:
+        existing = {import_hash for import_hash, in conn.execute("""
+            SELECT import_hash FROM expenses
+            WHERE user_id = ? AND import_hash IS NOT NULL
+              AND import_hash IN (SELECT value FROM json_each(?))
+        """, (user_id, json.dumps([batch[i][0] for i in blank])))}
+    blank = [i for i in blank if batch[i][0] not in existing]
+    if not blank:
+        return batch
+    rows = [batch[i] for i in blank]
+    filled = categorizer.fill_missing(models, [row[4] for row in rows], [row[2] for row in rows],
+                                      [row[3] for row in rows])
+    batch = list(batch)
+    for i, row, category in zip(blank, rows, filled.tolist()):
+        batch[i] = row[:3] + (category,) + row[4:]
+    return batch
+
+
+def _write_batch(user_id, batch):
+    with transaction() as conn:
+        # Rowids only grow while we hold the write lock, so everything above the
+        # current maximum afterwards is exactly what this batch inserted.
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM expenses").fetchone()[0]
+        conn.executemany("""
+            INSERT OR IGNORE INTO expenses (user_id, import_hash, date, amount, category, description)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, ((user_id,) + row for row in batch))
+        inserted = conn.execute("SELECT COUNT(*) FROM expenses WHERE id > ?", (last_id,)).fetchone()[0]
+        if inserted:
+            new_rows = "(SELECT id, date, amount, category FROM expenses WHERE id > ?)"
+            rollups.add_batch(conn, user_id, new_rows, (last_id,))
+            anomalies.add_batch(conn, user_id, new_rows, (last_id,))
+            conn.execute("UPDATE users SET data_version = data_version + 1 WHERE id = ?", (user_id,))
+    return inserted
+
+
+def import_statement(user_id, stream, fmt, total_bytes=None, batch_size=BATCH_SIZE,
+                     signed=False, progress=None):
+    """Import a binary statement stream for a user; returns the final ImportProgress.
+
+    `progress`, if given, is called with an ImportProgress after every batch.
+    """
+    if fmt not in PARSERS:
+        raise StatementError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    rows_read = inserted = 0
+    batch = []
+    models = categorizer.load_models(user_id)
+
+    def report():
+        state = ImportProgress(rows_read, inserted, rows_read - inserted, stream.tell(), total_bytes)
+        if progress:
+            progress(state)
+        return state
+
+    try:
+        for import_hash, txn in with_hashes(PARSERS[fmt](text, signed=signed)):
+            batch.append((import_hash, txn.date, txn.amount, txn.category, txn.description))
+            if len(batch) >= batch_size:
+                rows_read += len(batch)
+                inserted += _write_batch(user_id, _categorize(user_id, models, batch))
+                batch = []
+                report()
+        if batch:
+            rows_read += len(batch)
+            inserted += _write_batch(user_id, _categorize(user_id, models, batch))
+        return report()
+    finally:
+        text.detach()
+
+
+# ============ CLI ============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a bank statement into the expense tracker.")
+    parser.add_argument('path', help="CSV, OFX/QFX or QIF statement")
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--format', choices=FORMATS, help="override detection from the file extension")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--signed', action='store_true',
+                        help="CSV amounts are signed; import negative amounts as expenses")
+    args = parser.parse_args(argv)
+
+    def show(state):
+        pct = f" ({state.bytes_read / state.total_bytes:.0%})" if state.total_bytes else ""
+        print(f"\r{state.rows_read:,} rows read, {state.inserted:,} imported{pct}", end='', file=sys.stderr)
+
+    fmt = args.format or detect_format(args.path)
+    with open(args.path, 'rb') as stream:
+        result = import_statement(args.user_id, stream, fmt, total_bytes=os.path.getsize(args.path),
+                                  batch_size=args.batch_size, signed=args.signed, progress=show)
+    print(file=sys.stderr)
+    print(f"Imported {result.inserted:,} of {result.rows_read:,} transactions "
+          f"({result.duplicates:,} duplicates skipped).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Spending insights evaluated over the expense rollup tables.
+
+Every rule reads one category x month matrix built from the rollup rows, so
+the cost grows with months x categories, not with how many expenses a user
+has. A rule takes a Context and returns a list of messages; register new
+ones with the @rule decorator:
+
+    >>> @rule
+    ... def quiet_month(ctx):
+    ...     return ["..."] if ctx.totals[-1] == 0 else []
+    >>> evaluate(load_context(user_id))
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import rollups
+from expense_cache import user_expenses
+
+# ============ CONFIG ============
+SURGE_RATIO = 1.2  # latest month vs the category's average month
+WEEKDAY_RATIO = 1.25  # busiest weekday vs the average of the other days
+
+# months and categories label the rows and columns of `amounts` (zero where
+# nothing was spent); `active` marks the non-empty cells; totals is per month;
+# weekday is a Series of average expense per weekday name, Monday first.
+Context = namedtuple('Context', 'months categories amounts active totals weekday')
+
+RULES = []
+
+
+def rule(fn):
+    """Register `fn(context) -> list of messages` as an insight rule."""
+    RULES.append(fn)
+    return fn
+
+
+# ============ CONTEXT ============
+def build_context(category_monthly, weekday):
+    """Pivot rollups.category_monthly() rows into a (month x category) matrix."""
+    month_codes, months = pd.factorize(category_monthly['month'], sort=True)
+    category_codes, categories = pd.factorize(category_monthly['category'], sort=True)
+    amounts = np.zeros((len(months), len(categories)))
+    active = np.zeros(amounts.shape, dtype=bool)
+    amounts[month_codes, category_codes] = category_monthly['amount'].to_numpy(dtype=float)
+    active[month_codes, category_codes] = True
+    return Context(np.asarray(months), np.asarray(categories), amounts, active,
+                   amounts.sum(axis=1), weekday)
+
+
+def load_context(user_id, weekday=None):
+    """Context for a user; pass `weekday` when the caller already has it."""
+    if weekday is None:
+        weekday = user_expenses(user_id).weekday_means()
+    return build_context(rollups.category_monthly(user_id), weekday)
+
+
+def evaluate(context, rules=None):
+    """Messages from every rule, in registration order."""
+    if not len(context.months):
+        return []
+    return [message for check in (RULES if rules is None else rules) for message in check(context)]
+
+
+# ============ RULES ============
+@rule
+def monthly_swing(ctx):
+    """Latest month more than one standard deviation from the average month."""
+    if len(ctx.totals) < 2:
+        return []
+    mean, std = ctx.totals.mean(), ctx.totals.std(ddof=1)
+    if ctx.totals[-1] > mean + std:
+        return ["📈 Your spending this month is higher than usual."]
+    if ctx.totals[-1] < mean - std:
+        return ["📉 Your spending this month is lower than usual."]
+    return []
+
+
+@rule
+def category_surge(ctx):
+    """Categories whose latest month is well above their average earlier month with spending."""
+    earlier = ctx.active[:-1].sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average = ctx.amounts[:-1].sum(axis=0) / earlier
+    surging = ctx.active[-1] & (earlier > 0) & (ctx.amounts[-1] > average * SURGE_RATIO)
+    return [f"⚠️ {category} expenses have increased significantly." for category in ctx.categories[surging]]
+
+
+@rule
+def new_category(ctx):
+    """Categories with spending this month and never before."""
+    if len(ctx.months) < 2:
+        return []
+    first = ctx.active[-1] & ~ctx.active[:-1].any(axis=0)
+    return [f"🆕 This is your first month with {category} expenses." for category in ctx.categories[first]]
+
+
+@rule
+def weekday_peak(ctx):
+    """A weekday that averages well above the other days."""
+    if len(ctx.weekday) < 2:
+        return []
+    means = ctx.weekday.to_numpy(dtype=float)
+    peak = int(np.argmax(means))
+    others = np.delete(means, peak).mean()
+    if others > 0 and means[peak] > others * WEEKDAY_RATIO:
+        return [f"🗓️ You spend the most on {ctx.weekday.index[peak]}s, "
+                f"{means[peak] / others - 1:.0%} more than on other days."]
+    return []
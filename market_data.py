@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, timedelta
+
+import pandas as pd
+import streamlit as st
+
+import price_store
+from market_providers import (PROVIDER, TIMEOUT, MarketDataError, NoData, ProviderTimeout,
+                              make_provider)
+
+logger = logging.getLogger(__name__)
+
+# ============ CONFIG ============
+DEFAULT_SYMBOLS = ('RELIANCE.NS', 'TCS.NS', 'HDFCBANK.NS', 'INFY.NS', 'WIPRO.NS')
+CACHE_TTL = 300  # seconds; shared by every session in the process
+MAX_WORKERS = int(os.environ.get('FINANCE_MARKET_WORKERS', '8'))
+BREAKER_THRESHOLD = 3   # consecutive failed refreshes before the circuit opens
+BREAKER_RESET = 60.0    # seconds before a trial refresh is allowed again
+PERIOD_DAYS = {'5d': 7, '1mo': 31, '3mo': 92, '6mo': 183, '1y': 366, '2y': 731}
+
+
+# ============ RESILIENCE ============
+class CircuitOpen(MarketDataError):
+    message = "Market data refresh is paused after repeated provider failures."
+
+
+class CircuitBreaker:
+    """Stops calling a failing provider for `reset_after` seconds.
+
+    Opens after `failure_threshold` consecutive failed refreshes; once the
+    cool-down passes a single trial refresh is let through (half-open) and its
+    outcome decides whether the circuit closes again.
+    """
+
+    def __init__(self, failure_threshold=3, reset_after=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+@st.cache_resource
+def get_breaker():
+    return CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET)
+
+
+@st.cache_resource
+def get_fetch_pool():
+    # Shared by all sessions so concurrent cold fetches stay bounded per process
+    return ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='market-data')
+
+
+# ============ FETCHING ============
+# History plus the reason the last refresh failed, if it did. `stale` lists the
+# symbols that could not be refreshed and are served from their last stored bars.
+MarketSnapshot = namedtuple('MarketSnapshot', 'history error stale')
+
+
+@st.cache_resource
+def get_provider():
+    return make_provider(PROVIDER)
+
+
+def update_store(symbols, today=None, provider=None, timeout=TIMEOUT, since=None):
+    """Fetch the bars missing from the local price store, one symbol per pooled task.
+
+    `since` ({symbol: date}) asks for history back to each date; see
+    price_store.missing_ranges().
+
+    Waits at most `timeout` seconds overall, stores whatever arrived and returns
+    {symbol: error message} for the symbols that failed or timed out. Raises
+    CircuitOpen without calling the provider while the breaker is open.
+    """
+    provider = provider or get_provider()
+    breaker = get_breaker()
+    if not breaker.allow():
+        raise CircuitOpen()
+
+    today = today or date.today()
+    end = today + timedelta(days=1)
+    pool = get_fetch_pool()
+    futures = {
+        pool.submit(provider.history, [symbol], start, end, timeout): symbol
+        for start, group in price_store.missing_ranges(symbols, today, since).items()
+        for symbol in group
+    }
+    done, pending = wait(futures, timeout=timeout)
+
+    fetched, failed = {}, {}
+    for future in pending:
+        future.cancel()
+        failed[futures[future]] = ProviderTimeout.message
+    for future in done:
+        try:
+            fetched.update(future.result())
+        except NoData:
+            continue
+        except MarketDataError as e:
+            failed[futures[future]] = e.message
+        except Exception as e:
+            logger.warning("Unexpected market data failure for %s", futures[future], exc_info=True)
+            failed[futures[future]] = MarketDataError.message
+
+    price_store.store(fetched)
+    if futures and len(failed) == len(futures):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return failed
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_history(symbols, period='1mo', since=None):
+    """Daily OHLCV per symbol from the local store, gap-filled at most once per TTL.
+
+    `since` is passed to update_store() to backfill further than usual.
+
+    Symbols whose refresh fails are still served from their last stored bars
+    and listed in MarketSnapshot.stale.
+    """
+    error, failed = None, {}
+    try:
+        failed = update_store(symbols, since=since)
+    except MarketDataError as e:
+        logger.warning("Market data refresh skipped (%s)", type(e).__name__)
+        error = e.message
+        failed = dict.fromkeys(symbols, e.message)
+    else:
+        if failed and len(failed) == len(symbols):
+            error = next(iter(failed.values()))
+    start = date.today() - timedelta(days=PERIOD_DAYS.get(period, 31))
+    history = price_store.read_history(symbols, start=start)
+    if not history and error is None:
+        error = NoData.message
+    stale = tuple(symbol for symbol in symbols if symbol in failed and symbol in history)
+    return MarketSnapshot(history, error, stale)
+
+
+# ============ DERIVED VIEWS ============
+def quote_table(history):
+    """Latest session per symbol, derived from the daily series instead of a separate 1d fetch."""
+    market_data = pd.DataFrame(columns=['Price', 'Change', 'Change %'], dtype=float)
+    for symbol, hist in history.items():
+        last = hist.iloc[-1]
+        market_data.loc[symbol, 'Price'] = last['Close']
+        market_data.loc[symbol, 'Change'] = last['Close'] - last['Open']
+        market_data.loc[symbol, 'Change %'] = ((last['Close'] - last['Open']) / last['Open']) * 100
+    return market_data
@@ -0,0 +1,194 @@
+"""Market data providers.
+
+Every provider returns daily OHLCV history as {symbol: DataFrame} indexed by
+date, and raises a MarketDataError subclass rather than failing silently. Pick
+one with FINANCE_MARKET_PROVIDER:
+
+    yfinance      live Yahoo Finance data (default)
+    random-walk   deterministic synthetic prices for offline load tests;
+                  FINANCE_MARKET_LATENCY_MS simulates upstream latency
+
+Fetched bars are persisted in the price store, so point FINANCE_DB_PATH at a
+scratch database when benchmarking with synthetic data.
+"""
+import logging
+import os
+import time
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# ============ CONFIG ============
+PROVIDER = os.environ.get('FINANCE_MARKET_PROVIDER', 'yfinance')
+TIMEOUT = float(os.environ.get('FINANCE_MARKET_TIMEOUT', '10'))
+LATENCY_MS = float(os.environ.get('FINANCE_MARKET_LATENCY_MS', '0'))
+OHLCV = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+# ============ ERRORS ============
+class MarketDataError(Exception):
+    """Base class for provider failures."""
+    message = "Unable to fetch market data."
+
+
+class ProviderTimeout(MarketDataError):
+    message = "The market data provider timed out."
+
+
+class ProviderUnavailable(MarketDataError):
+    message = "The market data provider is unreachable. Please check your internet connection."
+
+
+class NoData(MarketDataError):
+    message = "The market data provider returned no prices for these symbols."
+
+
+# ============ INTERFACE ============
+class MarketDataProvider:
+    name = 'base'
+
+    def history(self, symbols, start, end, timeout=TIMEOUT):
+        """Daily bars for start <= date < end as {symbol: OHLCV DataFrame}.
+
+        Symbols without data are omitted; NoData is raised only if none have any.
+        """
+        raise NotImplementedError
+
+    def quotes(self, symbols, timeout=TIMEOUT):
+        """Latest bar per symbol as a DataFrame indexed by symbol (Price, Change, Change %)."""
+        today = date.today()
+        history = self.history(symbols, today - timedelta(days=7), today + timedelta(days=1), timeout)
+        rows = {}
+        for symbol, frame in history.items():
+            last = frame.iloc[-1]
+            change = last['Close'] - last['Open']
+            rows[symbol] = {'Price': last['Close'], 'Change': change,
+                            'Change %': change / last['Open'] * 100}
+        return pd.DataFrame.from_dict(rows, orient='index', columns=['Price', 'Change', 'Change %'])
+
+
+# ============ YFINANCE ============
+class _LogCapture(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = 'yfinance'
+
+    def history(self, symbols, start, end, timeout=TIMEOUT):
+        import yfinance as yf
+
+        # yfinance logs per-symbol failures instead of raising; capture them so
+        # an empty result can be told apart from a network failure.
+        capture = _LogCapture()
+        yf_logger = logging.getLogger('yfinance')
+        yf_logger.addHandler(capture)
+        try:
+            data = yf.download(list(symbols), start=start.isoformat(), end=end.isoformat(),
+                               group_by='ticker', auto_adjust=False, progress=False,
+                               threads=True, timeout=timeout)
+        except TimeoutError as e:
+            raise ProviderTimeout(str(e)) from e
+        except OSError as e:
+            raise ProviderUnavailable(str(e)) from e
+        finally:
+            yf_logger.removeHandler(capture)
+
+        history = split_download(data, symbols)
+        if not history:
+            errors = ' '.join(capture.messages).lower()
+            if 'timed out' in errors or 'timeout' in errors:
+                raise ProviderTimeout(errors)
+            if 'resolve host' in errors or 'connect' in errors or 'dnserror' in errors:
+                raise ProviderUnavailable(errors)
+            raise NoData(', '.join(symbols))
+        return history
+
+
+def split_download(data, symbols):
+    """Split a yf.download frame into {symbol: OHLCV DataFrame}, dropping empty symbols."""
+    history = {}
+    if data is None or data.empty:
+        return history
+    for symbol in symbols:
+        if isinstance(data.columns, pd.MultiIndex):
+            if symbol not in data.columns.get_level_values(0):
+                continue
+            frame = data[symbol]
+        else:
+            frame = data
+        frame = frame[[col for col in OHLCV if col in frame.columns]].dropna(subset=['Close'])
+        if not frame.empty:
+            history[symbol] = frame
+    return history
+
+
+# ============ SYNTHETIC ============
+class RandomWalkProvider(MarketDataProvider):
+    """Deterministic geometric random walk per symbol, for offline benchmarks.
+
+    Each symbol's path is generated from a fixed origin with a seed derived from
+    the symbol, so any window of it is identical across calls and processes.
+    `latency` (seconds) is slept per call; calls slower than `timeout` raise
+    ProviderTimeout after waiting `timeout`.
+    """
+    name = 'random-walk'
+    ORIGIN = date(2000, 1, 3)
+
+    def __init__(self, seed=0, latency=LATENCY_MS / 1000, daily_vol=0.015, drift=0.0004):
+        self.seed = seed
+        self.latency = latency
+        self.daily_vol = daily_vol
+        self.drift = drift
+
+    def _series(self, symbol, end):
+        days = pd.bdate_range(self.ORIGIN, end - timedelta(days=1))
+        rng = np.random.default_rng([self.seed, zlib.crc32(symbol.encode('utf-8'))])
+        base = 100 + rng.random() * 2900
+        returns = rng.normal(self.drift, self.daily_vol, size=(len(days), 3))
+        close = base * np.exp(np.cumsum(returns[:, 0]))
+        open_ = close * np.exp(returns[:, 1] / 2)
+        spread = np.abs(returns[:, 2]) * close
+        return pd.DataFrame({
+            'Open': open_,
+            'High': np.maximum(open_, close) + spread,
+            'Low': np.minimum(open_, close) - spread,
+            'Close': close,
+            'Volume': rng.integers(10_000, 5_000_000, size=len(days)).astype(float),
+        }, index=days)
+
+    def history(self, symbols, start, end, timeout=TIMEOUT):
+        if self.latency:
+            if timeout is not None and self.latency > timeout:
+                time.sleep(timeout)
+                raise ProviderTimeout(f"{self.name} exceeded {timeout:.1f}s")
+            time.sleep(self.latency)
+        start = pd.Timestamp(start)
+        history = {}
+        for symbol in symbols:
+            series = self._series(symbol, end)
+            series = series[series.index >= start]
+            if not series.empty:
+                history[symbol] = series
+        if not history:
+            raise NoData(', '.join(symbols))
+        return history
+
+
+PROVIDERS = {
+    YFinanceProvider.name: YFinanceProvider,
+    RandomWalkProvider.name: RandomWalkProvider,
+}
+
+
+def make_provider(name=PROVIDER):
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown market data provider {name!r}; expected one of {', '.join(PROVIDERS)}")
+    return PROVIDERS[name]()
@@ -0,0 +1,452 @@
+from datetime import datetime
+
+
+# ============ MIGRATIONS ============
+# Each migration is (version, description, statements). Versions are applied in
+# order, each in its own transaction, and recorded in schema_version. Never edit
+# a released migration; append a new one instead.
+
+def _m001_base_tables():
+    return [
+        '''CREATE TABLE IF NOT EXISTS users
+           (id INTEGER PRIMARY KEY,
+            username TEXT UNIQUE,
+            email TEXT UNIQUE,
+            password TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS expenses
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            date TEXT,
+            amount REAL,
+            category TEXT,
+            description TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS goals
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            name TEXT,
+            target_amount REAL,
+            current_amount REAL,
+            target_date TEXT,
+            priority TEXT)''',
+    ]
+
+
+def _m002_foreign_keys_and_indexes():
+    # SQLite cannot add a foreign key to an existing table, so both tables are
+    # rebuilt. Rows whose owner no longer exists are unreachable and dropped.
+    return [
+        '''CREATE TABLE expenses_new
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            date TEXT,
+            amount REAL,
+            category TEXT,
+            description TEXT)''',
+        '''INSERT INTO expenses_new (id, user_id, date, amount, category, description)
+           SELECT id, user_id, date, amount, category, description
+           FROM expenses
+           WHERE user_id IN (SELECT id FROM users)''',
+        "DROP TABLE expenses",
+        "ALTER TABLE expenses_new RENAME TO expenses",
+        "CREATE INDEX idx_expenses_user_date ON expenses(user_id, date)",
+
+        '''CREATE TABLE goals_new
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            name TEXT,
+            target_amount REAL,
+            current_amount REAL,
+            target_date TEXT,
+            priority TEXT)''',
+        '''INSERT INTO goals_new (id, user_id, name, target_amount, current_amount,
+                                  target_date, priority)
+           SELECT id, user_id, name, target_amount, current_amount, target_date, priority
+           FROM goals
+           WHERE user_id IN (SELECT id FROM users)''',
+        "DROP TABLE goals",
+        "ALTER TABLE goals_new RENAME TO goals",
+        "CREATE INDEX idx_goals_user_target_date ON goals(user_id, target_date)",
+    ]
+
+
+def _m003_expense_rollups():
+    # Rollups are maintained by triggers so every write path (the Add Expense
+    # form, bulk imports, cascading account deletes) updates them in the same
+    # transaction as the row change. Use rollups.rebuild() to backfill.
+    tables = [
+        '''CREATE TABLE expense_daily
+           (user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            day TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)) WITHOUT ROWID''',
+        '''CREATE TABLE expense_monthly
+           (user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            month TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month)) WITHOUT ROWID''',
+        '''CREATE TABLE expense_category_monthly
+           (user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, category)) WITHOUT ROWID''',
+    ]
+
+    def add(row):
+        return f"""
+            INSERT INTO expense_daily (user_id, day, total, count)
+            VALUES ({row}.user_id, {row}.date, COALESCE({row}.amount, 0), 1)
+            ON CONFLICT (user_id, day) DO UPDATE
+            SET total = total + excluded.total, count = count + 1;
+            INSERT INTO expense_monthly (user_id, month, total, count)
+            VALUES ({row}.user_id, substr({row}.date, 1, 7), COALESCE({row}.amount, 0), 1)
+            ON CONFLICT (user_id, month) DO UPDATE
+            SET total = total + excluded.total, count = count + 1;
+            INSERT INTO expense_category_monthly (user_id, month, category, total, count)
+            VALUES ({row}.user_id, substr({row}.date, 1, 7),
+                    COALESCE(NULLIF({row}.category, ''), 'Uncategorized'),
+                    COALESCE({row}.amount, 0), 1)
+            ON CONFLICT (user_id, month, category) DO UPDATE
+            SET total = total + excluded.total, count = count + 1;"""
+
+    def remove(row):
+        return f"""
+            UPDATE expense_daily
+            SET total = total - COALESCE({row}.amount, 0), count = count - 1
+            WHERE user_id = {row}.user_id AND day = {row}.date;
+            DELETE FROM expense_daily
+            WHERE user_id = {row}.user_id AND day = {row}.date AND count <= 0;
+            UPDATE expense_monthly
+            SET total = total - COALESCE({row}.amount, 0), count = count - 1
+            WHERE user_id = {row}.user_id AND month = substr({row}.date, 1, 7);
+            DELETE FROM expense_monthly
+            WHERE user_id = {row}.user_id AND month = substr({row}.date, 1, 7) AND count <= 0;
+            UPDATE expense_category_monthly
+            SET total = total - COALESCE({row}.amount, 0), count = count - 1
+            WHERE user_id = {row}.user_id AND month = substr({row}.date, 1, 7)
+              AND category = COALESCE(NULLIF({row}.category, ''), 'Uncategorized');
+            DELETE FROM expense_category_monthly
+            WHERE user_id = {row}.user_id AND month = substr({row}.date, 1, 7)
+              AND category = COALESCE(NULLIF({row}.category, ''), 'Uncategorized')
+              AND count <= 0;"""
+
+    triggers = [
+        f"""CREATE TRIGGER expenses_rollup_insert AFTER INSERT ON expenses
+            WHEN NEW.date IS NOT NULL
+            BEGIN {add('NEW')}
+            END""",
+        f"""CREATE TRIGGER expenses_rollup_delete AFTER DELETE ON expenses
+            WHEN OLD.date IS NOT NULL
+            BEGIN {remove('OLD')}
+            END""",
+        f"""CREATE TRIGGER expenses_rollup_update_old AFTER UPDATE OF user_id, date, amount, category ON expenses
+            WHEN OLD.date IS NOT NULL
+            BEGIN {remove('OLD')}
+            END""",
+        f"""CREATE TRIGGER expenses_rollup_update_new AFTER UPDATE OF user_id, date, amount, category ON expenses
+            WHEN NEW.date IS NOT NULL
+            BEGIN {add('NEW')}
+            END""",
+    ]
+
+    backfill = [
+        '''INSERT INTO expense_daily (user_id, day, total, count)
+           SELECT user_id, date, SUM(COALESCE(amount, 0)), COUNT(*)
+           FROM expenses WHERE date IS NOT NULL
+           GROUP BY user_id, date''',
+        '''INSERT INTO expense_monthly (user_id, month, total, count)
+           SELECT user_id, substr(date, 1, 7), SUM(COALESCE(amount, 0)), COUNT(*)
+           FROM expenses WHERE date IS NOT NULL
+           GROUP BY user_id, substr(date, 1, 7)''',
+        '''INSERT INTO expense_category_monthly (user_id, month, category, total, count)
+           SELECT user_id, substr(date, 1, 7), COALESCE(NULLIF(category, ''), 'Uncategorized'),
+                  SUM(COALESCE(amount, 0)), COUNT(*)
+           FROM expenses WHERE date IS NOT NULL
+           GROUP BY user_id, substr(date, 1, 7), COALESCE(NULLIF(category, ''), 'Uncategorized')''',
+    ]
+    return tables + triggers + backfill
+
+
+def _m004_user_data_version():
+    # Bumped on every expense change so in-process caches can validate entries
+    # with a primary-key lookup instead of re-reading the user's rows.
+    bump = "UPDATE users SET data_version = data_version + 1 WHERE id = {row}.user_id;"
+    return [
+        "ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0",
+        f"""CREATE TRIGGER expenses_version_insert AFTER INSERT ON expenses
+            BEGIN {bump.format(row='NEW')} END""",
+        f"""CREATE TRIGGER expenses_version_delete AFTER DELETE ON expenses
+            BEGIN {bump.format(row='OLD')} END""",
+        f"""CREATE TRIGGER expenses_version_update AFTER UPDATE ON expenses
+            BEGIN {bump.format(row='OLD')} {bump.format(row='NEW')} END""",
+    ]
+
+
+def _m005_import_hash():
+    # Imported rows carry a content hash used for de-duplication. The bulk
+    # importer applies rollups and the data version bump once per batch, so the
+    # per-row insert triggers skip rows that have an import_hash.
+    rollup_insert = [stmt for stmt in _m003_expense_rollups()
+                     if stmt.startswith("CREATE TRIGGER expenses_rollup_insert")][0]
+    version_insert = [stmt for stmt in _m004_user_data_version()
+                      if stmt.startswith("CREATE TRIGGER expenses_version_insert")][0]
+    return [
+        "ALTER TABLE expenses ADD COLUMN import_hash INTEGER",
+        '''CREATE UNIQUE INDEX idx_expenses_user_import_hash
+           ON expenses(user_id, import_hash) WHERE import_hash IS NOT NULL''',
+        "DROP TRIGGER expenses_rollup_insert",
+        rollup_insert.replace("WHEN NEW.date IS NOT NULL",
+                              "WHEN NEW.date IS NOT NULL AND NEW.import_hash IS NULL"),
+        "DROP TRIGGER expenses_version_insert",
+        version_insert.replace("AFTER INSERT ON expenses",
+                               "AFTER INSERT ON expenses WHEN NEW.import_hash IS NULL"),
+    ]
+
+
+def _m006_price_store():
+    # Daily bars keyed by (symbol, date); clustered on the key so a symbol's
+    # history is one contiguous range scan over memory-mapped pages.
+    return [
+        '''CREATE TABLE prices
+           (symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL NOT NULL,
+            volume REAL,
+            PRIMARY KEY (symbol, date)) WITHOUT ROWID''',
+    ]
+
+
+def _m007_watchlists():
+    return [
+        '''CREATE TABLE watchlists
+           (user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            symbol TEXT NOT NULL,
+            added_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, symbol)) WITHOUT ROWID''',
+    ]
+
+
+def _m008_holdings_ledger():
+    # One holding per (user, symbol); transactions carry signed quantities
+    # (buys positive, sells negative) and are the only source of positions.
+    return [
+        '''CREATE TABLE holdings
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            symbol TEXT NOT NULL,
+            asset_class TEXT NOT NULL,
+            UNIQUE (user_id, symbol))''',
+        '''CREATE TABLE transactions
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            holding_id INTEGER NOT NULL REFERENCES holdings(id) ON DELETE CASCADE,
+            date TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            price REAL NOT NULL,
+            fees REAL NOT NULL DEFAULT 0)''',
+        "CREATE INDEX idx_transactions_user_date ON transactions(user_id, date)",
+        "CREATE INDEX idx_transactions_holding ON transactions(holding_id)",
+    ]
+
+
+def _m009_forecast_models():
+    # Serialized per-user forecasting state; data_version is the users value
+    # the model was last brought up to date with.
+    return [
+        '''CREATE TABLE forecast_models
+           (user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            data_version INTEGER NOT NULL,
+            model BLOB NOT NULL,
+            updated_at TEXT NOT NULL)''',
+    ]
+
+
+def _m010_category_models():
+    # Pickled, sparsified per-user expense categorizers; labels counts the
+    # expenses each has learned from.
+    return [
+        '''CREATE TABLE category_models
+           (user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            labels INTEGER NOT NULL,
+            model BLOB NOT NULL,
+            updated_at TEXT NOT NULL)''',
+    ]
+
+
+def _m011_expense_anomalies():
+    # Exponentially weighted mean/variance of expense amounts per (user,
+    # category), updated on every insert; an expense more than 3 standard
+    # deviations above its category's mean (after 5 earlier expenses) is
+    # flagged before the stats absorb it. The warm-up weight 1/(count + 1)
+    # makes early stats the plain running mean and variance. anomalies.py
+    # applies the same update to imported rows, which bypass this trigger.
+    alpha, min_count, z = 0.05, 5, 3.0
+    weight = f"max({alpha}, 1.0 / (count + 1))"
+    category = "COALESCE(NULLIF(NEW.category, ''), 'Uncategorized')"
+    return [
+        '''CREATE TABLE expense_stats
+           (user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            variance REAL NOT NULL,
+            PRIMARY KEY (user_id, category)) WITHOUT ROWID''',
+        '''CREATE TABLE expense_anomalies
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            expense_id INTEGER NOT NULL UNIQUE REFERENCES expenses(id) ON DELETE CASCADE,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            expected REAL NOT NULL,
+            variance REAL NOT NULL,
+            detected_at TEXT NOT NULL DEFAULT (datetime('now')))''',
+        "CREATE INDEX idx_expense_anomalies_user ON expense_anomalies(user_id, id)",
+        f"""CREATE TRIGGER expenses_anomaly_insert AFTER INSERT ON expenses
+            WHEN NEW.date IS NOT NULL AND NEW.amount IS NOT NULL AND NEW.import_hash IS NULL
+            BEGIN
+                INSERT INTO expense_anomalies (user_id, expense_id, category, amount, expected, variance)
+                SELECT NEW.user_id, NEW.id, category, NEW.amount, mean, variance
+                FROM expense_stats
+                WHERE user_id = NEW.user_id AND category = {category}
+                  AND count >= {min_count} AND variance > 0 AND NEW.amount > mean
+                  AND (NEW.amount - mean) * (NEW.amount - mean) > {z * z} * variance;
+                INSERT INTO expense_stats (user_id, category, count, mean, variance)
+                VALUES (NEW.user_id, {category}, 1, NEW.amount, 0)
+                ON CONFLICT (user_id, category) DO UPDATE SET
+                    count = count + 1,
+                    mean = mean + {weight} * (excluded.mean - mean),
+                    variance = (1 - {weight}) * (variance + {weight} * (excluded.mean - mean) * (excluded.mean - mean));
+            END""",
+        # Seed the stats from existing history without flagging any of it
+        '''INSERT INTO expense_stats (user_id, category, count, mean, variance)
+           SELECT user_id, COALESCE(NULLIF(category, ''), 'Uncategorized'), COUNT(*), AVG(amount),
+                  MAX(AVG(amount * amount) - AVG(amount) * AVG(amount), 0)
+           FROM expenses WHERE date IS NOT NULL AND amount IS NOT NULL
+           GROUP BY user_id, COALESCE(NULLIF(category, ''), 'Uncategorized')''',
+    ]
+
+
+def _m012_alerts():
+    # A missing notification_prefs row means every notification is on.
+    # alert_outbox is the delivery queue; its UNIQUE key makes re-running the
+    # alert job idempotent.
+    return [
+        '''CREATE TABLE notification_prefs
+           (user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            unusual_expenses INTEGER NOT NULL DEFAULT 1,
+            monthly_report INTEGER NOT NULL DEFAULT 1,
+            investment_alerts INTEGER NOT NULL DEFAULT 1,
+            goal_alerts INTEGER NOT NULL DEFAULT 1)''',
+        '''CREATE TABLE budgets
+           (user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            category TEXT NOT NULL,
+            monthly_limit REAL NOT NULL,
+            PRIMARY KEY (user_id, category)) WITHOUT ROWID''',
+        '''CREATE TABLE price_alerts
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            symbol TEXT NOT NULL,
+            direction TEXT NOT NULL CHECK (direction IN ('above', 'below')),
+            threshold REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            triggered_at TEXT,
+            triggered_price REAL)''',
+        "CREATE INDEX idx_price_alerts_user ON price_alerts(user_id)",
+        "CREATE INDEX idx_price_alerts_active ON price_alerts(symbol) WHERE triggered_at IS NULL",
+        '''CREATE TABLE alert_outbox
+           (id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            sent_at TEXT,
+            UNIQUE (user_id, kind, key))''',
+        "CREATE INDEX idx_alert_outbox_pending ON alert_outbox(id) WHERE sent_at IS NULL",
+    ]
+
+
+def _m013_watchlist_customized():
+    # Users who have never edited their watchlist see the default symbols;
+    # once they have, an empty watchlist stays empty.
+    return [
+        "ALTER TABLE users ADD COLUMN watchlist_customized INTEGER NOT NULL DEFAULT 0",
+        "UPDATE users SET watchlist_customized = 1 WHERE id IN (SELECT user_id FROM watchlists)",
+    ]
+
+
+def _m014_investment_opt_outs():
+    # The live price matcher re-reads the opted-out users on every quote refresh
+    return [
+        '''CREATE INDEX idx_notification_prefs_no_investment_alerts
+           ON notification_prefs(user_id) WHERE investment_alerts = 0''',
+    ]
+
+
+MIGRATIONS = [
+    (1, "base tables", _m001_base_tables),
+    (2, "foreign keys and per-user indexes", _m002_foreign_keys_and_indexes),
+    (3, "expense rollup tables", _m003_expense_rollups),
+    (4, "per-user data version", _m004_user_data_version),
+    (5, "import de-duplication hash", _m005_import_hash),
+    (6, "local price store", _m006_price_store),
+    (7, "per-user watchlists", _m007_watchlists),
+    (8, "holdings and transactions ledger", _m008_holdings_ledger),
+    (9, "cached forecasting models", _m009_forecast_models),
+    (10, "per-user expense categorizers", _m010_category_models),
+    (11, "streaming expense anomaly detection", _m011_expense_anomalies),
+    (12, "notification preferences, budgets and alert outbox", _m012_alerts),
+    (13, "explicit watchlist customization flag", _m013_watchlist_customized),
+    (14, "index of users without investment alerts", _m014_investment_opt_outs),
+]
+
+
+# ============ RUNNER ============
+def current_version(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                     description TEXT,
+                     applied_at TEXT NOT NULL)''')
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations on an autocommit connection; returns the schema version."""
+    version = current_version(conn)
+    if version >= MIGRATIONS[-1][0]:
+        return version
+
+    # Table rebuilds need foreign key enforcement off; the pragma is a no-op
+    # inside a transaction, so toggle it around the whole run.
+    conn.execute("PRAGMA foreign_keys=OFF")
+    try:
+        for target, description, statements in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-read under the write lock in case another process migrated
+                version = current_version(conn)
+                if target <= version:
+                    conn.rollback()
+                    continue
+                for statement in statements():
+                    conn.execute(statement)
+                violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+                if violations:
+                    raise RuntimeError(f"Migration {target} left foreign key violations: {violations[:5]}")
+                conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                             (target, description, datetime.now().isoformat(timespec='seconds')))
+                conn.commit()
+                version = target
+            except BaseException:
+                conn.rollback()
+                raise
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
+    return version
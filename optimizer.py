@@ -0,0 +1,126 @@
+"""Long-only mean-variance portfolio optimization over the local price store.
+
+Expected returns and covariance are estimated from daily closes and cached
+per (universe, lookback), so moving a slider only re-runs the optimizer,
+which is a handful of small matrix products:
+
+    >>> est = estimate_from_history(price_store.read_history(UNIVERSE))
+    >>> front = efficient_frontier(est.mean, est.cov)
+    >>> weights = recommend(front, 'Moderate', age=35)
+"""
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import market_data
+
+# ============ CONFIG ============
+# Index ETFs standing in for the asset classes of the old rule-based split
+ASSET_LABELS = {
+    'NIFTYBEES.NS': 'Large Cap',
+    'JUNIORBEES.NS': 'Next 50',
+    'MID150BEES.NS': 'Mid Cap',
+    'HDFCSML250.NS': 'Small Cap',
+    'GOLDBEES.NS': 'Gold',
+    'LTGILTBEES.NS': 'Govt. Bonds',
+}
+UNIVERSE = tuple(filter(None, os.environ.get('FINANCE_OPTIMIZER_UNIVERSE', ','.join(ASSET_LABELS)).split(',')))
+TRADING_DAYS = 252
+MIN_OBSERVATIONS = 60  # days of overlapping history needed before optimizing
+RISK_AVERSIONS = np.logspace(-1, 3, 80)
+# Where each profile sits between the minimum-variance (0) and maximum-return (1) portfolios
+RISK_PROFILES = {'Conservative': 0.15, 'Moderate': 0.5, 'Aggressive': 0.85}
+
+# Annualized estimates; `observations` is the number of daily returns used
+Estimates = namedtuple('Estimates', 'symbols mean cov observations')
+# One row of `weights` per point; returns and volatilities are annualized
+Portfolios = namedtuple('Portfolios', 'weights returns volatilities')
+
+
+class InsufficientHistory(ValueError):
+    pass
+
+
+# ============ ESTIMATION ============
+def estimate_from_history(history, min_observations=MIN_OBSERVATIONS):
+    """Annualized mean and covariance of daily log returns over the dates all symbols share."""
+    closes = pd.DataFrame({symbol: frame['Close'] for symbol, frame in history.items()}).dropna()
+    returns = np.log(closes).diff().dropna()
+    if len(returns) < min_observations or returns.shape[1] < 2:
+        raise InsufficientHistory(
+            f"Need at least {min_observations} days of shared price history for two or more assets.")
+    values = returns.to_numpy()
+    return Estimates(tuple(closes.columns), values.mean(axis=0) * TRADING_DAYS,
+                     np.cov(values, rowvar=False) * TRADING_DAYS, len(values))
+
+
+@st.cache_data(ttl=market_data.CACHE_TTL, show_spinner=False)
+def estimate(symbols, period='2y'):
+    """Cached estimates for a universe, gap-filling the price store first.
+
+    Returns (Estimates or None, error message or None).
+    """
+    snapshot = market_data.fetch_history(tuple(symbols), period)
+    try:
+        return estimate_from_history(snapshot.history), snapshot.error
+    except InsufficientHistory as e:
+        return None, snapshot.error or str(e)
+
+
+# ============ OPTIMIZATION ============
+def portfolio_stats(weights, mean, cov):
+    """Annualized return and volatility of each row of `weights`."""
+    weights = np.atleast_2d(weights)
+    variance = np.einsum('ij,jk,ik->i', weights, cov, weights)
+    return weights @ mean, np.sqrt(np.maximum(variance, 0.0))
+
+
+def project_simplex(v):
+    """Euclidean projection of each row of `v` onto {w >= 0, sum(w) = 1}."""
+    u = -np.sort(-v, axis=1)
+    cumulative = np.cumsum(u, axis=1) - 1
+    k = np.arange(1, v.shape[1] + 1)
+    rho = np.count_nonzero(u - cumulative / k > 0, axis=1)
+    theta = cumulative[np.arange(len(v)), rho - 1] / rho
+    return np.maximum(v - theta[:, None], 0.0)
+
+
+def efficient_frontier(mean, cov, risk_aversions=RISK_AVERSIONS, iterations=500):
+    """Long-only frontier: maximize w.mean - a/2 w.cov.w for every risk aversion a at once.
+
+    Solved by projected gradient ascent on all aversions together, each with
+    its own 1/Lipschitz step. Points come back ordered by volatility.
+    """
+    aversions = np.asarray(risk_aversions, dtype=float)[:, None]
+    step = 1.0 / (aversions * np.linalg.eigvalsh(cov)[-1])
+    weights = np.full((len(aversions), len(mean)), 1.0 / len(mean))
+    for _ in range(iterations):
+        weights = project_simplex(weights + step * (mean - aversions * (weights @ cov)))
+    returns, volatilities = portfolio_stats(weights, mean, cov)
+    order = np.argsort(volatilities)
+    return Portfolios(weights[order], returns[order], volatilities[order])
+
+
+def random_portfolios(mean, cov, count=20000, seed=0):
+    """Uniformly sampled long-only portfolios, for plotting the feasible region."""
+    weights = np.random.default_rng(seed).dirichlet(np.ones(len(mean)), size=count)
+    return Portfolios(weights, *portfolio_stats(weights, mean, cov))
+
+
+def recommend(frontier, profile, age=None):
+    """Frontier weights for a risk profile, shifted towards lower risk with age.
+
+    The profile picks a point between the lowest- and highest-volatility
+    frontier portfolios; every decade past 40 moves it 5% towards the former.
+    """
+    position = RISK_PROFILES[profile]
+    if age is not None:
+        position -= max(0, age - 40) / 200
+    position = min(1.0, max(0.0, position))
+    low, high = frontier.volatilities[0], frontier.volatilities[-1]
+    target = low + position * (high - low)
+    index = min(np.searchsorted(frontier.volatilities, target), len(frontier.weights) - 1)
+    return frontier.weights[index]
@@ -0,0 +1,218 @@
+"""In-process matching of live quotes against users' price alerts.
+
+Active alerts are indexed per symbol as two threshold ladders sorted
+ascending. An 'above' alert fires once the price reaches its threshold, so
+the alerts a quote triggers are always the lowest untriggered rungs of the
+'above' ladder, and likewise the highest rungs of the 'below' ladder. Each
+ladder keeps a window of untriggered rungs, and a quote is matched with one
+binary search per ladder, then the window shrinks past what fired. The cost
+per quote is O(log n + fired) however many alerts are registered:
+
+    >>> index = PriceAlertIndex()
+    >>> index.match({'RELIANCE.NS': 2950.0})     # [(alert id, price), ...]
+
+The quote refresher feeds every snapshot through on_snapshot(). Alerts on
+symbols nobody is watching are left to the `alerts.py --evaluate` job.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import streamlit as st
+
+import alerts
+from db import connect, transaction
+
+# ============ CONFIG ============
+PENDING_LIMIT = 10000  # alerts added or re-admitted since the last rebuild before rebuilding
+REBUILD_INTERVAL = 3600.0  # seconds; also drops alerts deleted or fired elsewhere
+
+
+# ============ INDEX ============
+class _Ladder:
+    """One symbol's alerts in one direction; rungs lo..hi are untriggered."""
+
+    __slots__ = ('thresholds', 'ids', 'users', 'lo', 'hi')
+
+    def __init__(self, thresholds, ids, users):
+        self.thresholds = thresholds
+        self.ids = ids
+        self.users = users
+        self.lo, self.hi = 0, len(ids)
+
+    def rise_to(self, price):
+        """Fire 'above' alerts with threshold <= price; returns their rung slice."""
+        cut = self.lo + int(np.searchsorted(self.thresholds[self.lo:self.hi], price, side='right'))
+        fired, self.lo = slice(self.lo, cut), cut
+        return fired
+
+    def fall_to(self, price):
+        """Fire 'below' alerts with threshold >= price; returns their rung slice."""
+        cut = self.lo + int(np.searchsorted(self.thresholds[self.lo:self.hi], price, side='left'))
+        fired, self.hi = slice(cut, self.hi), cut
+        return fired
+
+
+def _ladders(ids, users, symbols, thresholds):
+    """{symbol: _Ladder} from parallel arrays, with one sort for every symbol."""
+    if not len(ids):
+        return {}
+    uniques, codes = np.unique(symbols, return_inverse=True)
+    order = np.lexsort((thresholds, codes))
+    codes, ids, users, thresholds = codes[order], ids[order], users[order], thresholds[order]
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1, [len(codes)]])
+    return {uniques[codes[start]]: _Ladder(thresholds[start:end], ids[start:end], users[start:end])
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())}
+
+
+class PriceAlertIndex:
+    """Untriggered price alerts of every user, indexed for matching quotes.
+
+    Alerts added after the last rebuild are picked up by id and checked
+    linearly until the next rebuild. Alerts removed or fired elsewhere may
+    still match until then; the guarded UPDATE in fire() ignores them.
+
+    Alerts of users who turned investment alerts off are held per user
+    instead of matching, including any that leave a ladder after the user
+    opted out. Each sync() re-reads who is opted out and moves the held
+    alerts of users who opted back in to the pending list, so a preference
+    change never needs a rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._above = self._below = {}
+        self._pending = defaultdict(list)  # symbol -> [(id, user id, direction, threshold)]
+        self._pending_count = 0
+        self._held = defaultdict(list)  # user id -> [(id, symbol, direction, threshold)]
+        self._opted_out = frozenset()
+        self._last_id = 0
+        self._built_at = None
+
+    def __len__(self):
+        with self._lock:
+            return sum(ladder.hi - ladder.lo for index in (self._above, self._below)
+                       for ladder in index.values()) + self._pending_count + \
+                sum(len(alerts) for alerts in self._held.values())
+
+    def rebuild(self):
+        with connect() as conn:
+            last_id, = conn.execute("SELECT COALESCE(MAX(id), 0) FROM price_alerts").fetchone()
+            opted_out = _opted_out(conn)
+            rows = conn.execute("""
+                SELECT id, user_id, symbol, direction = 'above', threshold FROM price_alerts
+                WHERE triggered_at IS NULL AND id <= ?
+            """, (last_id,)).fetchall()
+        ids, users, symbols, above, thresholds = (np.array(column) for column in zip(*rows)) if rows else \
+            (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, object), np.empty(0, bool), np.empty(0))
+        above = above.astype(bool)
+        held = np.isin(users, list(opted_out))
+        with self._lock:
+            self._above = _ladders(*(column[above & ~held] for column in (ids, users, symbols, thresholds)))
+            self._below = _ladders(*(column[~above & ~held] for column in (ids, users, symbols, thresholds)))
+            self._pending.clear()
+            self._pending_count = 0
+            self._held.clear()
+            for alert_id, user_id, symbol, is_above, threshold in zip(
+                    *(column[held].tolist() for column in (ids, users, symbols, above, thresholds))):
+                self._held[user_id].append((alert_id, symbol, 'above' if is_above else 'below', threshold))
+            self._opted_out = opted_out
+            self._last_id = last_id
+            self._built_at = time.monotonic()
+
+    def sync(self):
+        """Pick up alerts and preference changes since the last call, rebuilding when due."""
+        if (self._built_at is None or self._pending_count > PENDING_LIMIT
+                or time.monotonic() - self._built_at > REBUILD_INTERVAL):
+            self.rebuild()
+            return
+        with connect() as conn:
+            opted_out = _opted_out(conn)
+            rows = conn.execute("""
+                SELECT id, user_id, symbol, direction, threshold FROM price_alerts
+                WHERE id > ? AND triggered_at IS NULL ORDER BY id
+            """, (self._last_id,)).fetchall()
+        with self._lock:
+            for user_id in self._opted_out - opted_out:
+                for alert_id, symbol, direction, threshold in self._held.pop(user_id, ()):
+                    self._pending[symbol].append((alert_id, user_id, direction, threshold))
+                    self._pending_count += 1
+            self._opted_out = opted_out
+            for alert_id, user_id, symbol, direction, threshold in rows:
+                self._pending[symbol].append((alert_id, user_id, direction, threshold))
+            self._pending_count += len(rows)
+            if rows:
+                self._last_id = rows[-1][0]
+
+    def match(self, prices):
+        """Alerts triggered by {symbol: price}, as (alert id, price) pairs; each fires once."""
+        matches = []
+        with self._lock:
+            for symbol, price in prices.items():
+                if price != price:  # NaN
+                    continue
+                for index, direction in ((self._above, 'above'), (self._below, 'below')):
+                    ladder = index.get(symbol)
+                    if ladder is None:
+                        continue
+                    fired = ladder.rise_to(price) if direction == 'above' else ladder.fall_to(price)
+                    for alert_id, user_id, threshold in zip(ladder.ids[fired].tolist(), ladder.users[fired].tolist(),
+                                                            ladder.thresholds[fired].tolist()):
+                        if user_id in self._opted_out:
+                            self._held[user_id].append((alert_id, symbol, direction, threshold))
+                        else:
+                            matches.append((alert_id, price))
+                pending = self._pending.get(symbol)
+                if pending:
+                    crossed = [alert for alert in pending
+                               if (price >= alert[3] if alert[2] == 'above' else price <= alert[3])]
+                    if crossed:
+                        for alert_id, user_id, direction, threshold in crossed:
+                            if user_id in self._opted_out:
+                                self._held[user_id].append((alert_id, symbol, direction, threshold))
+                            else:
+                                matches.append((alert_id, price))
+                        pending[:] = [alert for alert in pending if alert not in crossed]
+                        self._pending_count -= len(crossed)
+        return matches
+
+    def on_snapshot(self, snapshot):
+        """Quote refresher listener: match the snapshot's latest prices and record what fired."""
+        self.sync()
+        return fire(self.match(snapshot.quotes['Price'].to_dict()))
+
+
+def _opted_out(conn):
+    """Users who turned investment alerts off (read through a partial index)."""
+    return frozenset(user_id for user_id, in conn.execute(
+        "SELECT user_id FROM notification_prefs WHERE investment_alerts = 0"))
+
+
+# ============ WRITES ============
+def fire(matches, now=None):
+    """Record triggered alerts and queue their emails in one transaction; returns the count."""
+    if not matches:
+        return 0
+    now = (now or datetime.now()).isoformat(timespec='seconds')
+    with transaction() as conn:
+        # Skips alerts already fired or deleted, and users who turned investment alerts off
+        fired = conn.execute("""
+            WITH matched AS (
+                SELECT json_extract(value, '$[0]') AS id, json_extract(value, '$[1]') AS price
+                FROM json_each(?)
+            )
+            UPDATE price_alerts SET triggered_at = ?, triggered_price = matched.price
+            FROM matched
+            WHERE price_alerts.id = matched.id AND price_alerts.triggered_at IS NULL
+              AND price_alerts.user_id NOT IN (SELECT user_id FROM notification_prefs WHERE investment_alerts = 0)
+            RETURNING price_alerts.id
+        """, (json.dumps(matches), now)).fetchall()
+        return alerts.queue_price_alerts(conn, [alert_id for alert_id, in fired])
+
+
+@st.cache_resource
+def get_price_alert_index():
+    return PriceAlertIndex()
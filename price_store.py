@@ -0,0 +1,134 @@
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db import connect, transaction
+
+# ============ CONFIG ============
+# How far back to fetch the first time a symbol is seen
+BACKFILL_DAYS = int(os.environ.get('FINANCE_PRICE_BACKFILL_DAYS', '730'))
+# A first stored bar this close after a requested start already covers it
+# (weekends, holidays, listing days)
+BACKFILL_SLACK_DAYS = 7
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+# ============ GAP PLANNING ============
+def stored_spans(symbols):
+    """First and last stored bar dates per symbol ('YYYY-MM-DD'); unseen symbols are omitted."""
+    if not symbols:
+        return {}
+    placeholders = ','.join('?' * len(symbols))
+    with connect() as conn:
+        rows = conn.execute(f"""
+            SELECT symbol, MIN(date), MAX(date) FROM prices
+            WHERE symbol IN ({placeholders})
+            GROUP BY symbol
+        """, list(symbols)).fetchall()
+    return {symbol: (first, last) for symbol, first, last in rows}
+
+
+def last_dates(symbols):
+    """Most recent stored bar date per symbol ('YYYY-MM-DD'); unseen symbols are omitted."""
+    return {symbol: last for symbol, (_, last) in stored_spans(symbols).items()}
+
+
+def missing_ranges(symbols, today=None, since=None):
+    """Group symbols by the first date that still has to be fetched.
+
+    The last stored bar is re-requested because today's bar keeps changing
+    until the market closes. Unseen symbols are backfilled BACKFILL_DAYS, or
+    from their date in `since` ({symbol: date}) if that is earlier; a stored
+    symbol whose bars start well after its `since` date is refetched from it.
+    Returns {start_date: [symbols]}.
+    """
+    today = today or date.today()
+    since = since or {}
+    stored = stored_spans(symbols)
+    plan = defaultdict(list)
+    for symbol in symbols:
+        wanted = since.get(symbol)
+        if symbol not in stored:
+            start = today - timedelta(days=BACKFILL_DAYS)
+            if wanted is not None:
+                start = min(start, wanted)
+        else:
+            first, last = (date.fromisoformat(day) for day in stored[symbol])
+            start = last
+            if wanted is not None and first - wanted > timedelta(days=BACKFILL_SLACK_DAYS):
+                start = wanted
+        plan[start].append(symbol)
+    return dict(plan)
+
+
+# ============ WRITES ============
+def store(history):
+    """Upsert {symbol: OHLCV DataFrame indexed by date}; returns the number of bars written."""
+    rows = []
+    for symbol, frame in history.items():
+        dates = pd.DatetimeIndex(frame.index).strftime('%Y-%m-%d')
+        values = frame.reindex(columns=COLUMNS).astype(float)
+        values = values.astype(object).where(values.notna(), None)
+        rows.extend((symbol, day, *bar) for day, bar in zip(dates, values.itertuples(index=False)))
+    if rows:
+        with transaction() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO prices (symbol, date, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+    return len(rows)
+
+
+# ============ READS ============
+def read_history(symbols, start=None):
+    """Stored daily bars as {symbol: DataFrame[Open, High, Low, Close, Volume]} indexed by date."""
+    if not symbols:
+        return {}
+    placeholders = ','.join('?' * len(symbols))
+    params = list(symbols)
+    since = ''
+    if start is not None:
+        since = 'AND date >= ?'
+        params.append(str(start))
+    with connect() as conn:
+        df = pd.read_sql_query(f"""
+            SELECT symbol, date, open AS Open, high AS High, low AS Low,
+                   close AS Close, volume AS Volume
+            FROM prices
+            WHERE symbol IN ({placeholders}) {since}
+            ORDER BY symbol, date
+        """, conn, params=params)
+    df['date'] = pd.to_datetime(df['date'])
+    history = {symbol: frame.set_index('date')[COLUMNS]
+               for symbol, frame in df.groupby('symbol', sort=False)}
+    return {symbol: history[symbol] for symbol in symbols if symbol in history}
+
+
+
+def read_closes(symbols, start=None):
+    """Stored closes in long form for array code: code, day, close.
+
+    `code` is the symbol's position in `symbols` and `day` counts days since
+    1970-01-01, both computed by SQLite so no strings reach Python. Rows are
+    ordered by code and day.
+    """
+    if not len(symbols):
+        return pd.DataFrame({'code': np.array([], dtype=np.int64), 'day': np.array([], dtype=np.int64),
+                             'close': np.array([], dtype=float)})
+    wanted = ','.join('(?, ?)' for _ in symbols)
+    params = [value for code, symbol in enumerate(symbols) for value in (code, symbol)]
+    since = ''
+    if start is not None:
+        since = 'WHERE p.date >= ?'
+        params.append(str(start))
+    with connect() as conn:
+        return pd.read_sql_query(f"""
+            WITH wanted(code, symbol) AS (VALUES {wanted})
+            SELECT w.code, CAST(julianday(p.date) - 2440587.5 AS INTEGER) AS day, p.close
+            FROM wanted w JOIN prices p ON p.symbol = w.symbol
+            {since}
+            ORDER BY w.code, p.date
+        """, conn, params=params)
@@ -0,0 +1,169 @@
+"""Vectorized investment projections.
+
+Every function broadcasts over NumPy arrays of annual returns, inflation rates
+and tenures, so a whole grid of scenarios is computed in one pass:
+
+    >>> grid = scenario_grid('SIP', 5000, returns=np.arange(4, 20.5, 0.5),
+    ...                      inflation_rates=[4.5], years=np.arange(1, 41))
+    >>> grid.real.shape   # (returns, inflation rates, years)
+    (33, 1, 40)
+
+Rates are annual percentages. SIP contributions are made at the start of each
+month and compound monthly; lump sums compound annually. A step-up SIP raises
+the monthly contribution by `step_up` percent every 12 months.
+
+simulate() replaces the single expected return with random lognormal monthly
+returns and reports percentile bands over many paths.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+KINDS = ('SIP', 'Lump Sum')
+
+# invested is the cumulative amount paid in, nominal the portfolio value and
+# real the nominal value in today's money
+Projection = namedtuple('Projection', 'invested nominal real')
+
+
+# ============ CURVES ============
+def contributions(amount, months, step_up=0.0):
+    """Monthly SIP contributions for months 0..months-1."""
+    month = np.arange(months)
+    return amount * (1 + step_up / 100) ** (month // 12)
+
+
+def sip_curve(amount, annual_return, months, step_up=0.0):
+    """SIP value at the end of months 0..months, shape (*annual_return.shape, months + 1)."""
+    rate = np.asarray(annual_return, dtype=float)[..., None] / 1200
+    paid = contributions(amount, months, step_up)
+    growth = (1 + rate) ** np.arange(months + 1)
+    # V_t = sum_{m<t} c_m (1+r)^(t-m) = (1+r)^t * cumsum(c_m / (1+r)^m)
+    discounted = np.cumsum(paid / growth[..., :-1], axis=-1)
+    return growth * np.concatenate([np.zeros_like(discounted[..., :1]), discounted], axis=-1)
+
+
+def lump_sum_curve(amount, annual_return, months):
+    """Lump-sum value at the end of months 0..months, shape (*annual_return.shape, months + 1)."""
+    rate = np.asarray(annual_return, dtype=float)[..., None] / 100
+    return amount * (1 + rate) ** (np.arange(months + 1) / 12)
+
+
+def invested_curve(kind, amount, months, step_up=0.0):
+    """Cumulative amount paid in at the end of months 0..months."""
+    if kind == 'SIP':
+        return np.concatenate([[0.0], np.cumsum(contributions(amount, months, step_up))])
+    return np.full(months + 1, float(amount))
+
+
+def deflator(inflation_rate, months):
+    """Divide nominal values by this to express them in today's money."""
+    return (1 + np.asarray(inflation_rate, dtype=float) / 100) ** (np.asarray(months) / 12)
+
+
+# ============ SCENARIOS ============
+def project(kind, amount, annual_return, inflation_rate, months, step_up=0.0):
+    """Month-by-month Projection for one scenario, each curve of length months + 1."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown projection {kind!r}; expected one of {', '.join(KINDS)}")
+    if kind == 'SIP':
+        nominal = sip_curve(amount, annual_return, months, step_up)
+    else:
+        nominal = lump_sum_curve(amount, annual_return, months)
+    return Projection(invested_curve(kind, amount, months, step_up), nominal,
+                      nominal / deflator(inflation_rate, np.arange(months + 1)))
+
+
+def scenario_grid(kind, amount, returns, inflation_rates, years, step_up=0.0):
+    """Projection at the end of each tenure for every (return, inflation, tenure) combination.
+
+    `nominal` has shape (len(returns), len(years)), `real` has shape
+    (len(returns), len(inflation_rates), len(years)) and `invested` has shape
+    (len(years),). Tenures are whole years.
+    """
+    returns = np.asarray(returns, dtype=float)
+    inflation_rates = np.asarray(inflation_rates, dtype=float)
+    months = np.asarray(years, dtype=np.int64) * 12
+    curves = project(kind, amount, returns, 0.0, int(months.max()), step_up)
+    nominal = curves.nominal[:, months]
+    real = nominal[:, None, :] / deflator(inflation_rates[:, None], months)
+    return Projection(curves.invested[months], nominal, real)
+
+
+# ============ MONTE CARLO ============
+MC_CHUNK_PATHS = 10000  # paths simulated per chunk; bounds peak memory
+MC_WORKERS = int(os.environ.get('FINANCE_MC_WORKERS', '1'))
+PERCENTILES = (10, 50, 90)
+
+# checkpoints: months at which paths were recorded; bands: one row per
+# percentile over the checkpoints; final: every path's value at the end
+Simulation = namedtuple('Simulation', 'checkpoints percentiles bands final')
+
+
+def checkpoints(months):
+    """Months at which simulated paths are recorded: yearly, plus the final month."""
+    step = 12 if months >= 24 else 1
+    return np.unique(np.append(np.arange(0, months + 1, step), months))
+
+
+def _simulate_chunk(kind, amount, annual_return, volatility, months, step_up, paths, seed, at):
+    """Nominal values of `paths` simulated paths at the months in `at`, as float32 (paths, len(at))."""
+    rng = np.random.default_rng(seed)
+    # Lognormal monthly growth whose mean matches the deterministic curves:
+    # monthly compounding for SIPs, annual for lump sums
+    sigma = volatility / 100 / np.sqrt(12)
+    monthly = annual_return / 1200 if kind == 'SIP' else np.expm1(np.log1p(annual_return / 100) / 12)
+    mu = np.log1p(monthly) - sigma ** 2 / 2
+    log_growth = rng.standard_normal((paths, months), dtype=np.float32)
+    log_growth *= np.float32(sigma)
+    log_growth += np.float32(mu)
+    np.cumsum(log_growth, axis=1, out=log_growth)  # log G_1 .. log G_months
+
+    values = np.zeros((paths, len(at)), dtype=np.float32)
+    recorded = at > 0
+    growth_at = np.exp(log_growth[:, at[recorded] - 1])
+    if kind == 'SIP':
+        # V_t = G_t * sum_{m<t} c_m / G_m, with G_0 = 1
+        paid = contributions(amount, months, step_up).astype(np.float32)
+        scaled = np.empty_like(log_growth)
+        scaled[:, 0] = paid[0]
+        np.exp(np.negative(log_growth[:, :-1]), out=scaled[:, 1:])
+        scaled[:, 1:] *= paid[1:]
+        np.cumsum(scaled, axis=1, out=scaled)
+        values[:, recorded] = growth_at * scaled[:, at[recorded] - 1]
+    else:
+        values[:, recorded] = amount * growth_at
+    values[:, ~recorded] = 0.0 if kind == 'SIP' else amount
+    return values
+
+
+def simulate(kind, amount, annual_return, volatility, months, step_up=0.0, paths=10000,
+             seed=0, percentiles=PERCENTILES, chunk_paths=MC_CHUNK_PATHS, workers=MC_WORKERS):
+    """Monte Carlo projection over `paths` random return paths.
+
+    Paths are generated `chunk_paths` at a time, each chunk from its own child
+    of `seed`, so results depend only on the inputs, `seed` and `chunk_paths`,
+    not on `workers`. With workers > 1 chunks run in a process pool.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown projection {kind!r}; expected one of {', '.join(KINDS)}")
+    at = checkpoints(months)
+    sizes = [min(chunk_paths, paths - start) for start in range(0, paths, chunk_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(kind, amount, annual_return, volatility, months, step_up, size, child, at)
+            for size, child in zip(sizes, seeds)]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            chunks = list(pool.map(_simulate_chunk, *zip(*jobs)))
+    else:
+        chunks = [_simulate_chunk(*job) for job in jobs]
+    values = np.concatenate(chunks)
+    bands = np.percentile(values, percentiles, axis=0)
+    return Simulation(at, tuple(percentiles), bands, values[:, -1])
+
+
+def probability_of_reaching(simulation, target):
+    """Share of simulated paths whose final value is at least `target`."""
+    return float(np.mean(simulation.final >= target))
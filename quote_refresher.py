@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from types import MappingProxyType
+
+import streamlit as st
+
+import market_data
+import price_store
+from price_matcher import get_price_alert_index
+from market_providers import MarketDataError, NoData
+
+logger = logging.getLogger(__name__)
+
+# ============ CONFIG ============
+REFRESH_INTERVAL = float(os.environ.get('FINANCE_QUOTE_REFRESH_SECONDS', '60'))
+# Users who have not opened the dashboard for this long drop out of the fetch plan
+ACTIVE_WINDOW = float(os.environ.get('FINANCE_WATCHLIST_ACTIVE_SECONDS', '900'))
+SNAPSHOT_WAIT = 15.0  # seconds a page waits for symbols that were never fetched
+
+# Published as a whole and never mutated afterwards; treat the frames inside as read-only.
+# `symbols` is the fetch plan the snapshot was built from.
+QuoteSnapshot = namedtuple('QuoteSnapshot', 'symbols history quotes error stale refreshed_at')
+EMPTY_SNAPSHOT = QuoteSnapshot((), MappingProxyType({}), market_data.quote_table({}), None, (), None)
+
+
+# ============ FETCH PLANNING ============
+class FetchPlanner:
+    """Union of the base symbols and every recently active user's watchlist.
+
+    Each symbol is fetched once per refresh no matter how many users watch it.
+    """
+
+    def __init__(self, base_symbols, active_window=ACTIVE_WINDOW):
+        self.base_symbols = tuple(base_symbols)
+        self.active_window = active_window
+        self._watching = {}  # key -> (symbols, last seen)
+        self._lock = threading.Lock()
+
+    def track(self, key, symbols, now=None):
+        """Record that `key` is viewing `symbols`; returns the symbols new to the plan."""
+        now = now or time.monotonic()
+        with self._lock:
+            planned = self._plan(now)
+            self._watching[key] = (tuple(symbols), now)
+        return tuple(symbol for symbol in symbols if symbol not in planned)
+
+    def plan(self, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            return self._plan(now)
+
+    def _plan(self, now):
+        expired = [key for key, (_, seen) in self._watching.items() if now - seen > self.active_window]
+        for key in expired:
+            del self._watching[key]
+        symbols = dict.fromkeys(self.base_symbols)
+        for watched, _ in self._watching.values():
+            symbols.update(dict.fromkeys(watched))
+        return tuple(symbols)
+
+
+# ============ REFRESHER ============
+class QuoteRefresher(threading.Thread):
+    """One daemon thread per server process that polls the planned symbols.
+
+    Each refresh builds a new QuoteSnapshot and publishes it with a single
+    reference assignment, so sessions read `snapshot` without taking a lock and
+    upstream traffic no longer grows with the number of viewers. Every
+    published snapshot is also passed to each of `listeners`.
+    """
+
+    def __init__(self, planner, period='1mo', interval=REFRESH_INTERVAL, listeners=()):
+        super().__init__(name='quote-refresher', daemon=True)
+        self.planner = planner
+        self.period = period
+        self.interval = interval
+        self.listeners = tuple(listeners)
+        self.snapshot = EMPTY_SNAPSHOT
+        self._published = threading.Condition()
+        self._wake = threading.Event()
+        self._stopped = False
+
+    def run(self):
+        while not self._stopped:
+            started = time.monotonic()
+            # Cleared before refreshing so symbols tracked mid-refresh trigger another pass
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Quote refresh failed")
+            self._wake.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def track(self, key, symbols):
+        """Add a viewer's symbols to the plan, refreshing early if any are new."""
+        if self.planner.track(key, symbols):
+            self._wake.set()
+
+    def refresh(self):
+        symbols = self.planner.plan()
+        error, failed = None, {}
+        try:
+            failed = market_data.update_store(symbols)
+        except MarketDataError as e:
+            error = e.message
+            failed = dict.fromkeys(symbols, e.message)
+        else:
+            if failed and len(failed) == len(symbols):
+                error = next(iter(failed.values()))
+
+        start = date.today() - timedelta(days=market_data.PERIOD_DAYS.get(self.period, 31))
+        history = price_store.read_history(symbols, start=start)
+        if not history and error is None:
+            error = NoData.message
+        snapshot = QuoteSnapshot(
+            symbols,
+            MappingProxyType(history),
+            market_data.quote_table(history),
+            error,
+            tuple(symbol for symbol in symbols if symbol in failed and symbol in history),
+            datetime.now(),
+        )
+        with self._published:
+            self.snapshot = snapshot
+            self._published.notify_all()
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Quote listener %r failed", listener)
+        return snapshot
+
+    def wait_for(self, symbols, timeout=SNAPSHOT_WAIT):
+        """Block until a snapshot covering `symbols` has been published (or timeout)."""
+        with self._published:
+            self._published.wait_for(lambda: set(symbols) <= set(self.snapshot.symbols), timeout)
+        return self.snapshot
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+
+@st.cache_resource
+def get_refresher():
+    # Price alerts are matched against every snapshot as it is published
+    refresher = QuoteRefresher(FetchPlanner(market_data.DEFAULT_SYMBOLS),
+                               listeners=[get_price_alert_index().on_snapshot])
+    refresher.start()
+    return refresher
+
+
+def current_snapshot(viewer, symbols):
+    """Latest shared snapshot for a viewer's symbols.
+
+    Reads are lock-free once the symbols are in the plan; a viewer only waits
+    (briefly) the first time a symbol nobody was watching is requested.
+    """
+    refresher = get_refresher()
+    refresher.track(viewer, symbols)
+    snapshot = refresher.snapshot
+    if set(symbols) <= set(snapshot.symbols):
+        return snapshot
+    return refresher.wait_for(symbols)
@@ -4,10 +4,28 @@ import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime
-import yfinance as yf
 from streamlit_option_menu import option_menu
 import sqlite3
 import hashlib
+from db import connect, get_pool, transaction
+import rollups
+import charting
+import projections
+import goals
+import optimizer
+import holdings
+import valuation
+import tax_lots
+from expense_cache import user_expenses
+import insights
+import forecasting
+import categorizer
+import anomalies
+import alerts
+from importer import StatementError, detect_format, import_statement
+from exporter import EXPORTS, FORMATS, export_bytes, file_name as export_file_name
+from quote_refresher import current_snapshot
+from watchlists import add_symbols, get_watchlist, remove_symbols
 
 # ============ PAGE CONFIG ============
 st.set_page_config(
@@ -469,54 +487,18 @@ st.markdown(f"""
 
 
 # ============ DATABASE SETUP ============
-def init_db():
-    conn = sqlite3.connect('finance_tracker.db')
-    c = conn.cursor()
-    
-    # Users table (simplified)
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY,
-                  username TEXT UNIQUE,
-                  email TEXT UNIQUE,
-                  password TEXT)''')
-    
-    # Expenses table
-    c.execute('''CREATE TABLE IF NOT EXISTS expenses
-                 (id INTEGER PRIMARY KEY,
-                  user_id INTEGER,
-                  date TEXT,
-                  amount REAL,
-                  category TEXT,
-                  description TEXT)''')
-    
-    # Investment goals table
-    c.execute('''CREATE TABLE IF NOT EXISTS goals
-                 (id INTEGER PRIMARY KEY,
-                  user_id INTEGER,
-                  name TEXT,
-                  target_amount REAL,
-                  current_amount REAL,
-                  target_date TEXT,
-                  priority TEXT)''')
-    
-    conn.commit()
-    conn.close()
-
-# Initialize database
-init_db()
+# Creates the shared pool on first run; schema migrations run once per process
+get_pool()
 
 # ============ AUTHENTICATION ============
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def login_user(email, password):
-    conn = sqlite3.connect('finance_tracker.db')
-    c = conn.cursor()
     hashed_password = hash_password(password)
-    c.execute("SELECT id FROM users WHERE email=? AND password=?", 
-              (email, hashed_password))
-    result = c.fetchone()
-    conn.close()
+    with connect() as conn:
+        result = conn.execute("SELECT id FROM users WHERE email=? AND password=?",
+                              (email, hashed_password)).fetchone()
     if result:
         st.session_state.user_id = result[0]
         st.session_state.authenticated = True
@@ -524,18 +506,14 @@ def login_user(email, password):
     return False
 
 def register_user(username, email, password):
-    conn = sqlite3.connect('finance_tracker.db')
-    c = conn.cursor()
     try:
         hashed_password = hash_password(password)
-        c.execute("INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
-                 (username, email, hashed_password))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute("INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
+                         (username, email, hashed_password))
         return True, "Registration successful! Please login."
     except sqlite3.IntegrityError:
         return False, "Email or username already exists!"
-    finally:
-        conn.close()
 
 def auth_page():
     st.markdown("""
@@ -641,44 +619,68 @@ def dashboard():
     
     # Market Overview
     st.markdown("### Market Overview")
-    try:
-        # Fetch popular Indian stocks
-        symbols = ['RELIANCE.NS', 'TCS.NS', 'HDFCBANK.NS', 'INFY.NS', 'WIPRO.NS']
-        market_data = pd.DataFrame()
-        
-        for symbol in symbols:
-            stock = yf.Ticker(symbol)
-            hist = stock.history(period='1d')
-            if not hist.empty:
-                market_data.loc[symbol, 'Price'] = hist['Close'].iloc[-1]
-                market_data.loc[symbol, 'Change'] = hist['Close'].iloc[-1] - hist['Open'].iloc[-1]
-                market_data.loc[symbol, 'Change %'] = ((hist['Close'].iloc[-1] - hist['Open'].iloc[-1]) / hist['Open'].iloc[-1]) * 100
-        
-        st.dataframe(market_data.style.format({
-            'Price': '₹{:,.2f}',
-            'Change': '₹{:,.2f}',
-            'Change %': '{:,.2f}%'
-        }))
-        
-        # Market Trends Chart
-        st.markdown("### Market Trends (Last Month)")
-        fig = go.Figure()
-        for symbol in symbols:
-            stock = yf.Ticker(symbol)
-            hist = stock.history(period='1mo')
-            fig.add_trace(go.Scatter(x=hist.index, y=hist['Close'],
-                                   name=symbol, mode='lines'))
-        
-        fig.update_layout(
-            title='Stock Performance',
-            xaxis_title='Date',
-            yaxis_title='Price (₹)',
-            height=400
-        )
-        st.plotly_chart(fig, use_container_width=True)
-        
-    except Exception as e:
-        st.error("Unable to fetch market data. Please check your internet connection.")
+    user_id = st.session_state.user_id
+    symbols = list(get_watchlist(user_id))
+    
+    with st.expander("Edit Watchlist"):
+        new_symbols = st.text_input("Add symbols (comma separated, e.g. SBIN.NS, ITC.NS)")
+        if st.button("Add to Watchlist") and new_symbols:
+            add_symbols(user_id, new_symbols.split(','))
+            st.rerun()
+        removed = st.multiselect("Remove symbols", symbols)
+        if st.button("Remove Selected") and removed:
+            remove_symbols(user_id, removed)
+            st.rerun()
+    
+    if not symbols:
+        st.info("Your watchlist is empty. Add symbols above to track them here.")
+        return
+    
+    # Served from the shared background refresher, which fetches each symbol
+    # once per interval no matter how many users watch it
+    snapshot = current_snapshot(user_id, symbols)
+    history = {symbol: snapshot.history[symbol] for symbol in symbols if symbol in snapshot.history}
+    stale = [symbol for symbol in snapshot.stale if symbol in history]
+    error = snapshot.error
+    
+    if not history:
+        st.error(error or "No market data available for your watchlist yet.")
+        return
+    if error:
+        st.warning(f"{error} Showing the last stored prices.")
+    elif stale:
+        st.warning(f"Could not refresh {', '.join(stale)}. Showing the last stored prices.")
+    missing = [symbol for symbol in symbols if symbol not in history]
+    if missing:
+        if all(symbol in snapshot.symbols for symbol in missing):
+            st.caption(f"No data available for {', '.join(missing)}.")
+        else:
+            st.caption(f"No data yet for {', '.join(missing)}; it will appear after the next refresh.")
+    st.caption(f"Prices as of {snapshot.refreshed_at:%H:%M:%S}")
+    
+    market_data = snapshot.quotes.loc[list(history)]
+    st.dataframe(market_data.style.format({
+        'Price': '₹{:,.2f}',
+        'Change': '₹{:,.2f}',
+        'Change %': '{:,.2f}%'
+    }))
+    
+    # Market Trends Chart
+    st.markdown("### Market Trends (Last Month)")
+    fig = go.Figure()
+    points = charting.series_budget(len(history))
+    for symbol, hist in history.items():
+        hist = charting.downsample(hist, 'Close', max_points=points)
+        fig.add_trace(go.Scatter(x=hist.index, y=hist['Close'],
+                               name=symbol, mode='lines'))
+    
+    fig.update_layout(
+        title='Stock Performance',
+        xaxis_title='Date',
+        yaxis_title='Price (₹)',
+        height=400
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 # ============ EXPENSE TRACKER ============
 def expense_tracker():
@@ -699,73 +701,113 @@ def expense_tracker():
             expense_date = st.date_input("Date", datetime.now())
             expense_amount = st.number_input("Amount (₹)", min_value=0.0, step=100.0)
 
+        with col3:
+            expense_description = st.text_area("Description", height=100)
+
         with col2:
             default_categories = ["Needs", "Wants", "Investment", "Bills",
                                   "Entertainment", "Health", "Other"]
-            expense_category = st.selectbox("Category", default_categories)
+            # Pre-select the category predicted from the description; whatever
+            # the user saves is fed back to their categorizer
+            suggested = None
+            if expense_description.strip() and st.session_state.user_id:
+                predicted, confidence = categorizer.predict(categorizer.load_models(st.session_state.user_id),
+                                                            [expense_description], [expense_amount])
+                if confidence[0] >= categorizer.MIN_CONFIDENCE:
+                    suggested = predicted[0]
+            index = default_categories.index(suggested if suggested in default_categories else "Other") \
+                if suggested else 0
+            expense_category = st.selectbox("Category", default_categories, index=index)
             if expense_category == "Other":
-                expense_category = st.text_input("Specify Category")
-
-        with col3:
-            expense_description = st.text_area("Description", height=100)
+                expense_category = st.text_input("Specify Category",
+                                                 value=suggested if suggested and suggested not in default_categories else "")
+            if suggested:
+                st.caption(f"Suggested from the description: {suggested}")
 
         if st.button("Add Expense"):
             # Ensure you have logic to handle st.session_state.user_id
             # (likely set during user authentication).
             if st.session_state.user_id:
-                conn = sqlite3.connect('finance_tracker.db')
-                c = conn.cursor()
-                c.execute(
-                    """
-                    INSERT INTO expenses (user_id, date, amount, category, description)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        st.session_state.user_id,
-                        expense_date.strftime("%Y-%m-%d"),
-                        expense_amount,
-                        expense_category,
-                        expense_description,
-                    ),
-                )
-                conn.commit()
-                conn.close()
+                with transaction() as conn:
+                    conn.execute(
+                        """
+                        INSERT INTO expenses (user_id, date, amount, category, description)
+                        VALUES (?, ?, ?, ?, ?)
+                        """,
+                        (
+                            st.session_state.user_id,
+                            expense_date.strftime("%Y-%m-%d"),
+                            expense_amount,
+                            expense_category,
+                            expense_description,
+                        ),
+                    )
+                categorizer.learn(st.session_state.user_id, [expense_description], [expense_amount],
+                                  [expense_category])
                 st.success("Expense added successfully!")
             else:
                 st.error("User not authenticated. Please log in.")
 
+    # --- Import Bank Statement ---
+    with st.expander("Import Bank Statement"):
+        statement = st.file_uploader("Statement file (CSV, OFX/QFX or QIF)",
+                                     type=["csv", "ofx", "qfx", "qif"])
+        signed_amounts = st.checkbox("CSV amounts are signed (negative = expense)")
+
+        if statement is not None and st.button("Import Statement"):
+            if st.session_state.user_id:
+                progress_bar = st.progress(0.0, text="Importing...")
+
+                def show_progress(state):
+                    fraction = min(1.0, state.bytes_read / state.total_bytes) if state.total_bytes else 0.0
+                    progress_bar.progress(fraction, text=f"{state.rows_read:,} rows read, "
+                                                         f"{state.inserted:,} imported")
+
+                try:
+                    result = import_statement(
+                        st.session_state.user_id,
+                        statement,
+                        detect_format(statement.name),
+                        total_bytes=statement.size,
+                        signed=signed_amounts,
+                        progress=show_progress,
+                    )
+                except (StatementError, ValueError) as e:
+                    st.error(f"Could not import statement: {e}")
+                else:
+                    progress_bar.progress(1.0, text="Import complete")
+                    st.success(f"Imported {result.inserted:,} of {result.rows_read:,} transactions "
+                               f"({result.duplicates:,} duplicates skipped).")
+            else:
+                st.error("User not authenticated. Please log in.")
+
     # --- Expense Analysis ---
     if st.session_state.user_id:
-        conn = sqlite3.connect('finance_tracker.db')
-        df_expenses = pd.read_sql_query(
-            """
-            SELECT date, amount, category, description
-            FROM expenses
-            WHERE user_id = ?
-            """,
-            conn,
-            params=(st.session_state.user_id,),
-        )
-        conn.close()
+        # Summaries come from the rollup tables, so cost scales with the number
+        # of days/categories rather than the number of transactions.
+        daily_expenses = rollups.daily_totals(st.session_state.user_id)
+        category_expenses = rollups.category_totals(st.session_state.user_id)
 
-        if not df_expenses.empty:
+        if not daily_expenses.empty:
             # --- Summary Statistics ---
             st.markdown("### Expense Summary")
             col1, col2, col3 = st.columns(3)
 
             with col1:
-                total_expenses = df_expenses["amount"].sum()
+                total_expenses = daily_expenses["amount"].sum()
                 st.metric(
                     "Total Expenses",
                     f"{st.session_state.currency} {total_expenses:,.2f}"
                 )
 
             with col2:
-                avg_daily = df_expenses.groupby("date")["amount"].sum().mean()
+                avg_daily = daily_expenses["amount"].mean()
                 st.metric("Average Daily Expense", f"{avg_daily:,.2f}")
 
             with col3:
-                most_common_category = df_expenses["category"].mode()[0]
+                # Category with the most entries; ties resolve alphabetically
+                counts = category_expenses["count"].sort_index()
+                most_common_category = counts.idxmax()
                 st.metric("Most Common Category", most_common_category)
 
             # --- Visualizations ---
@@ -773,7 +815,7 @@ def expense_tracker():
 
             # Category-wise Pie Chart
             fig = px.pie(
-                df_expenses,
+                category_expenses.reset_index(),
                 values="amount",
                 names="category",
                 title="Expense Distribution by Category"
@@ -781,19 +823,33 @@ def expense_tracker():
             st.plotly_chart(fig)
 
             # Daily Expense Trend
-            df_expenses["date"] = pd.to_datetime(df_expenses["date"])
-            daily_expenses = (
-                df_expenses.groupby("date")["amount"].sum().reset_index()
-            )
-
             fig = px.line(
-                daily_expenses,
+                charting.downsample(daily_expenses, "amount", x="date"),
                 x="date",
                 y="amount",
                 title="Daily Expense Trend",
                 labels={"amount": "Amount (₹)", "date": "Date"},
             )
             st.plotly_chart(fig)
+
+            # --- Unusual Expenses ---
+            # Flagged as they were recorded, against each category's running stats
+            flagged = anomalies.recent(st.session_state.user_id)
+            if not flagged.empty:
+                st.markdown("### Unusual Expenses")
+                st.warning(f"{len(flagged)} recent expense(s) were well above your usual spending "
+                           "in their category.")
+                st.dataframe(
+                    flagged.rename(columns={"date": "Date", "description": "Description",
+                                            "category": "Category", "amount": "Amount",
+                                            "expected": "Usual Amount", "score": "Std. Devs Above"}),
+                    hide_index=True,
+                    column_config={
+                        "Amount": st.column_config.NumberColumn(format="₹%.2f"),
+                        "Usual Amount": st.column_config.NumberColumn(format="₹%.2f"),
+                        "Std. Devs Above": st.column_config.NumberColumn(format="%.1f"),
+                    },
+                )
         else:
             st.info("No expenses have been added yet.")
     else:
@@ -801,6 +857,106 @@ def expense_tracker():
 
 
 # ============ INVESTMENT PLANNER ============
+def rule_based_allocation(age, risk_profile):
+    """Fallback allocation from age and risk profile when there is no price history."""
+    # Calculate allocations based on age and risk profile
+    equity_percent = max(20, min(80, 100 - age))
+
+    if risk_profile == "Conservative":
+        equity_percent = max(20, equity_percent - 10)
+    elif risk_profile == "Aggressive":
+        equity_percent = min(80, equity_percent + 10)
+
+    debt_percent = 100 - equity_percent
+
+    # Equity breakdown
+    large_cap = equity_percent * 0.60
+    mid_cap = equity_percent * 0.25
+    small_cap = equity_percent * 0.15
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Broad Asset Allocation
+        fig = go.Figure(data=[go.Pie(
+            labels=['Equity', 'Debt'],
+            values=[equity_percent, debt_percent],
+            hole=.3
+        )])
+        fig.update_layout(title="Broad Asset Allocation")
+        st.plotly_chart(fig)
+
+    with col2:
+        # Equity Breakdown
+        fig = go.Figure(data=[go.Pie(
+            labels=['Large Cap', 'Mid Cap', 'Small Cap'],
+            values=[large_cap, mid_cap, small_cap],
+            hole=.3
+        )])
+        fig.update_layout(title="Equity Breakdown")
+        st.plotly_chart(fig)
+
+    st.markdown(f"""
+    ### Recommended Allocation
+
+    **Broad Asset Allocation:**
+    - Equity: {equity_percent:.1f}%
+    - Debt: {debt_percent:.1f}%
+
+    **Equity Breakdown:**
+    - Large Cap: {large_cap:.1f}%
+    - Mid Cap: {mid_cap:.1f}%
+    - Small Cap: {small_cap:.1f}%
+    """)
+
+
+
+def optimized_allocation(estimates, age, risk_profile):
+    """Efficient frontier and recommended weights for the estimated universe."""
+    frontier = optimizer.efficient_frontier(estimates.mean, estimates.cov)
+    cloud = optimizer.random_portfolios(estimates.mean, estimates.cov, count=5000)
+    weights = optimizer.recommend(frontier, risk_profile, age)
+    expected, volatility = (value[0] for value in optimizer.portfolio_stats(weights, estimates.mean, estimates.cov))
+    labels = [optimizer.ASSET_LABELS.get(symbol, symbol) for symbol in estimates.symbols]
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Expected Annual Return", f"{expected:.1%}")
+    col2.metric("Annual Volatility", f"{volatility:.1%}")
+    col3.metric("Return / Risk", f"{expected / volatility:.2f}" if volatility else "–")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        fig = go.Figure()
+        fig.add_trace(go.Scattergl(x=cloud.volatilities, y=cloud.returns, mode='markers',
+                                   marker=dict(size=3, opacity=0.3), name='Random Portfolios'))
+        fig.add_trace(go.Scatter(x=frontier.volatilities, y=frontier.returns, mode='lines',
+                                 name='Efficient Frontier'))
+        fig.add_trace(go.Scatter(x=[volatility], y=[expected], mode='markers',
+                                 marker=dict(size=14, symbol='star'), name=f'{risk_profile} Portfolio'))
+        fig.update_layout(title="Efficient Frontier", xaxis_title='Volatility', yaxis_title='Expected Return',
+                          xaxis_tickformat='.0%', yaxis_tickformat='.0%')
+        st.plotly_chart(fig)
+
+    with col2:
+        held = weights > 0.005
+        fig = go.Figure(data=[go.Pie(
+            labels=np.array(labels)[held],
+            values=weights[held],
+            hole=.3
+        )])
+        fig.update_layout(title="Recommended Allocation")
+        st.plotly_chart(fig)
+
+    st.caption(f"Estimated from {estimates.observations} trading days of local price history. "
+               "Past returns are not a guarantee of future performance.")
+
+
+@st.cache_data(show_spinner="Simulating return paths...", max_entries=32)
+def simulate_projection(kind, amount, annual_return, volatility, months, step_up, paths, seed):
+    return projections.simulate(kind, amount, annual_return, volatility, months, step_up, paths, seed)
+
+
 def investment_planner():
     """Calculates and visualizes investment projections."""
 
@@ -825,6 +981,8 @@ def investment_planner():
                 years = months / 12  # Calculate years from months
             expected_return = st.number_input("Expected Annual Return (%)", min_value=1.0, max_value=30.0,
                                             value=12.0)
+            step_up = st.number_input("Annual Step-up (%)", min_value=0.0, max_value=50.0, value=0.0,
+                                      help="Increase the monthly investment by this much every year")
         else:  # Lump Sum
             initial_investment = st.number_input("Lump Sum Investment (₹)", min_value=1000, value=50000)
             monthly_investment = 0  # For Lump Sum, no monthly investment
@@ -837,34 +995,28 @@ def investment_planner():
                 years = months / 12
             expected_return = st.number_input("Expected Annual Return (%)", min_value=1.0, max_value=30.0,
                                             value=12.0)
+            step_up = 0.0
 
         # --- Common Input Fields ---
         inflation_rate = st.slider("Assumed Inflation Rate (%)", 2.9, 8.9, 4.5)
         holding_period = st.selectbox("Holding Period", ["Less than 12 months", "More than 12 months"])
 
         # --- Calculations ---
-        monthly_rate = expected_return / (12 * 100)
-
-        if calc_type == "SIP":
-            # Adjust for Inflation (SIP) - Moved inside the 'if' block
-            real_return = (1 + monthly_rate) / (1 + inflation_rate / 1200) - 1
-            future_value = monthly_investment * ((pow(1 + real_return, months) - 1) / real_return) * (
-                        1 + real_return)
-            total_investment = monthly_investment * months
-        else:  # Lump Sum
-            # Adjust for Inflation (Lump Sum)
-            real_return = (1 + expected_return / 100) / (1 + inflation_rate / 100) - 1
-            future_value = initial_investment * pow(1 + real_return, years)
-            total_investment = initial_investment
+        amount = monthly_investment if calc_type == "SIP" else initial_investment
+        projection = projections.project(calc_type, amount, expected_return, inflation_rate,
+                                         int(months), step_up)
+        future_value = projection.nominal[-1]
+        total_investment = projection.invested[-1]
 
         total_returns = future_value - total_investment
-        inflation_adjusted_value = future_value / pow(1 + inflation_rate / 100, years)
+        inflation_adjusted_value = projection.real[-1]
 
-        # Tax Calculation (based on India's 2025 Budget)
+        # Tax Calculation (equity rates from the tax-lot rules)
+        equity_tax = tax_lots.TAX_RULES['Equity']
         if holding_period == "Less than 12 months":
-            tax_rate = 0.20  # STCG - 20%
+            tax_rate = equity_tax.stcg_rate
         else:
-            tax_rate = 0.125  # LTCG - 12.5%
+            tax_rate = equity_tax.ltcg_rate
 
         tax_amount = total_returns * tax_rate
         after_tax_returns = total_returns - tax_amount
@@ -893,26 +1045,82 @@ def investment_planner():
         # --- Growth Visualization ---
         st.markdown("### Investment Growth Projection")
         if period_unit == "Years":
-            period_range = np.arange(0, years + 1)
+            period_range = np.arange(0, int(months) // 12 + 1)
             x_axis_label = 'Years'
+            points = period_range * 12
         else:  # Months
-            period_range = np.arange(0, months + 1)
+            period_range = np.arange(0, int(months) + 1)
             x_axis_label = 'Months'
+            points = period_range
 
-        if calc_type == "SIP":
-            values = [monthly_investment * 12 * (period / 12) for period in
-                      period_range]  # Adjust for years/months
-            monthly_rate = expected_return / (12 * 100)
-            growth_values = [monthly_investment * ((pow(1 + monthly_rate, period) - 1) /
-                                                 monthly_rate) * (1 + monthly_rate)
-                            for period in period_range]
-            # ... (Rest of the growth visualization code)
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=period_range, y=projection.nominal[points], mode='lines',
+                                 name='Investment Growth'))
+        fig.add_trace(go.Scatter(x=period_range, y=projection.real[points], mode='lines',
+                                 name='Inflation-Adjusted'))
+        fig.add_trace(go.Scatter(x=period_range, y=projection.invested[points], mode='lines',
+                                 name='Amount Invested', line=dict(dash='dash')))
+        fig.update_layout(
+            title=f'{calc_type} Investment Growth',
+            xaxis_title=x_axis_label,
+            yaxis_title='Amount (₹)',
+            height=400
+        )
+        st.plotly_chart(fig)
 
+        # --- Sensitivity ---
+        st.markdown("### Sensitivity to Return and Tenure")
+        returns = np.arange(max(1.0, expected_return - 6), expected_return + 6.01, 0.5)
+        tenures = np.arange(1, 41)
+        grid = projections.scenario_grid(calc_type, amount, returns, [inflation_rate], tenures, step_up)
+        fig = go.Figure(data=go.Heatmap(
+            z=grid.real[:, 0, :],
+            x=tenures,
+            y=returns,
+            colorscale='Viridis',
+            colorbar=dict(title='₹ (today)'),
+            hovertemplate='%{x} years at %{y:.1f}%: ₹%{z:,.0f}<extra></extra>'
+        ))
+        fig.update_layout(
+            title=f'Inflation-Adjusted Value at {inflation_rate:.1f}% Inflation',
+            xaxis_title='Years',
+            yaxis_title='Expected Annual Return (%)',
+            height=450
+        )
+        st.plotly_chart(fig)
+
+        # --- Monte Carlo ---
+        st.markdown("### Monte Carlo Simulation")
+        if st.toggle("Simulate market risk", help="Replace the fixed return with thousands of random return paths"):
+            col1, col2, col3 = st.columns(3)
+            volatility = col1.number_input("Annual Volatility (%)", min_value=1.0, max_value=60.0, value=15.0)
+            paths = col2.select_slider("Simulated Paths", options=[10_000, 25_000, 50_000, 100_000],
+                                       value=10_000)
+            seed = col3.number_input("Random Seed", min_value=0, value=42, step=1)
+            target = st.number_input("Target Amount (₹)", min_value=0.0, value=float(round(future_value, -3)),
+                                     step=10000.0)
+
+            simulation = simulate_projection(calc_type, amount, expected_return, volatility, int(months),
+                                             step_up, paths, int(seed))
+            p10, p50, p90 = simulation.bands[:, -1]
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Pessimistic (P10)", f"₹{p10:,.0f}")
+            col2.metric("Median (P50)", f"₹{p50:,.0f}")
+            col3.metric("Optimistic (P90)", f"₹{p90:,.0f}")
+            col4.metric("Chance of Reaching Target",
+                        f"{projections.probability_of_reaching(simulation, target):.0%}")
+
+            x = simulation.checkpoints / 12 if period_unit == "Years" else simulation.checkpoints
             fig = go.Figure()
-            fig.add_trace(go.Scatter(x=period_range, y=growth_values, mode='lines', name='Investment Growth'))
+            fig.add_trace(go.Scatter(x=x, y=simulation.bands[2], mode='lines', line=dict(width=0),
+                                     name='P90', showlegend=False))
+            fig.add_trace(go.Scatter(x=x, y=simulation.bands[0], mode='lines', line=dict(width=0),
+                                     fill='tonexty', fillcolor='rgba(99, 110, 250, 0.2)', name='P10–P90'))
+            fig.add_trace(go.Scatter(x=x, y=simulation.bands[1], mode='lines', name='Median'))
+            fig.add_hline(y=target, line_dash='dash', annotation_text='Target')
             fig.update_layout(
-                title=f'{calc_type} Investment Growth',
-                xaxis_title=x_axis_label,  # Update x-axis title
+                title=f'{paths:,} Simulated Paths',
+                xaxis_title=x_axis_label,
                 yaxis_title='Amount (₹)',
                 height=400
             )
@@ -924,55 +1132,21 @@ def investment_planner():
         risk_profile = st.selectbox("Risk Profile",
                                      ["Conservative", "Moderate", "Aggressive"])
 
-        # Calculate allocations based on age and risk profile
-        equity_percent = max(20, min(80, 100 - age))
-
-        if risk_profile == "Conservative":
-            equity_percent = max(20, equity_percent - 10)
-        elif risk_profile == "Aggressive":
-            equity_percent = min(80, equity_percent + 10)
-
-        debt_percent = 100 - equity_percent
-
-        # Equity breakdown
-        large_cap = equity_percent * 0.60
-        mid_cap = equity_percent * 0.25
-        small_cap = equity_percent * 0.15
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            # Broad Asset Allocation
-            fig = go.Figure(data=[go.Pie(
-                labels=['Equity', 'Debt'],
-                values=[equity_percent, debt_percent],
-                hole=.3
-            )])
-            fig.update_layout(title="Broad Asset Allocation")
-            st.plotly_chart(fig)
-
-        with col2:
-            # Equity Breakdown
-            fig = go.Figure(data=[go.Pie(
-                labels=['Large Cap', 'Mid Cap', 'Small Cap'],
-                values=[large_cap, mid_cap, small_cap],
-                hole=.3
-            )])
-            fig.update_layout(title="Equity Breakdown")
-            st.plotly_chart(fig)
-
-        st.markdown(f"""
-        ### Recommended Allocation
-
-        **Broad Asset Allocation:**
-        - Equity: {equity_percent:.1f}%
-        - Debt: {debt_percent:.1f}%
-
-        **Equity Breakdown:**
-        - Large Cap: {large_cap:.1f}%
-        - Mid Cap: {mid_cap:.1f}%
-        - Small Cap: {small_cap:.1f}%
-        """)
+        col1, col2 = st.columns([3, 1])
+        assets = list(dict.fromkeys(optimizer.UNIVERSE + tuple(optimizer.ASSET_LABELS)))
+        universe = col1.multiselect("Asset Universe", assets, default=list(optimizer.UNIVERSE),
+                                    format_func=lambda symbol: optimizer.ASSET_LABELS.get(symbol, symbol))
+        lookback = col2.selectbox("Lookback", ["1y", "2y"], index=1)
+
+        # Estimates are cached per universe and lookback; only the optimizer reruns on changes
+        estimates, error = optimizer.estimate(tuple(universe), lookback)
+        if estimates is None:
+            st.warning(f"{error} Showing the rule-based allocation instead.")
+            rule_based_allocation(age, risk_profile)
+        else:
+            if error:
+                st.caption(f"{error} Using the last stored prices.")
+            optimized_allocation(estimates, age, risk_profile)
 
     with tab3:
         st.markdown("### Goal Tracker")
@@ -988,59 +1162,53 @@ def investment_planner():
 
                 submitted = st.form_submit_button("Add Goal")
                 if submitted:
-                    conn = sqlite3.connect('finance_tracker.db')
-                    c = conn.cursor()
-                    c.execute("""
-                        INSERT INTO goals (user_id, name, target_amount, current_amount,
-                                           target_date, priority)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (st.session_state.user_id, goal_name, goal_amount,
-                          current_amount, goal_date.strftime("%Y-%m-%d"), priority))
-                    conn.commit()
-                    conn.close()
+                    with transaction() as conn:
+                        conn.execute("""
+                            INSERT INTO goals (user_id, name, target_amount, current_amount,
+                                               target_date, priority)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        """, (st.session_state.user_id, goal_name, goal_amount,
+                              current_amount, goal_date.strftime("%Y-%m-%d"), priority))
                     st.success("Goal added successfully!")
 
         # Display Goals
-        conn = sqlite3.connect('finance_tracker.db')
-        df_goals = pd.read_sql_query("""
-            SELECT name, target_amount, current_amount, target_date, priority
-            FROM goals
-            WHERE user_id = ?
-        """, conn, params=(st.session_state.user_id,))
-        conn.close()
+        df_goals = goals.load_goals(st.session_state.user_id)
 
         if not df_goals.empty:
             st.markdown("### Your Financial Goals")
 
-            for _, goal in df_goals.iterrows():
-                progress = (goal['current_amount'] / goal['target_amount']) * 100
-
-                st.markdown(f"""
-                <div style='padding: 1rem; background-color: white; border-radius: 0.5rem;
-                            box-shadow: 0 2px 4px rgba(0,0,0,0.1); margin: 1rem 0;'>
-                    <h4>{goal['name']} ({goal['priority']} Priority)</h4>
-                </div>
-                """, unsafe_allow_html=True)
-
-                col1, col2 = st.columns(2)
-
-                with col1:
-                    st.progress(progress / 100)
-                    st.markdown(f"Progress: {progress:.1f}%")
-
-                with col2:
-                    st.markdown(f"""
-                    Target: ₹{goal['target_amount']:,.2f}
-                    Current: ₹{goal['current_amount']:,.2f}
-                    Target Date: {goal['target_date']}
-                    """)
+            col1, col2 = st.columns(2)
+            goal_return = col1.number_input("Expected Annual Return on Savings (%)", min_value=0.0,
+                                            max_value=30.0, value=8.0, key="goal_return")
+            budget = col2.number_input("Monthly Savings Budget (₹)", min_value=0, value=25000, step=1000,
+                                       key="goal_budget")
+            plan = goals.plan(df_goals, goal_return, budget)
 
-                # Calculate monthly savings needed
-                target_date = datetime.strptime(goal['target_date'], "%Y-%m-%d")
-                months_remaining = (target_date - datetime.now()).days / 30
-                if months_remaining > 0:
-                    monthly_needed = (goal['target_amount'] - goal['current_amount']) / months_remaining
-                    st.info(f"You need to save ₹{monthly_needed:,.2f} monthly to reach your goal")
+            needed = plan['Monthly Needed'].sum()
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Needed per Month", f"₹{needed:,.2f}")
+            col2.metric("Budget Shortfall", f"₹{max(0.0, needed - budget):,.2f}")
+            col3.metric("Goals on Track", f"{int(plan['On Track'].sum())} / {len(plan)}")
+
+            st.dataframe(
+                plan,
+                hide_index=True,
+                column_config={
+                    'Target': st.column_config.NumberColumn(format="₹%.2f"),
+                    'Saved': st.column_config.NumberColumn(format="₹%.2f"),
+                    'Progress': st.column_config.ProgressColumn(format="percent", min_value=0, max_value=1),
+                    'Target Date': st.column_config.DateColumn(),
+                    'Monthly Needed': st.column_config.NumberColumn(
+                        format="₹%.2f", help="Monthly saving that reaches the target on time at the expected return"),
+                    'Allocated': st.column_config.NumberColumn(
+                        format="₹%.2f", help="Share of the budget, filled by priority and then by target date"),
+                    'Projected Completion': st.column_config.DateColumn(
+                        help="When the goal is reached with the allocated amount"),
+                },
+            )
+            overdue = plan['Monthly Needed'].isna() & (plan['Progress'] < 1)
+            if overdue.any():
+                st.warning(f"{int(overdue.sum())} goal(s) are past their target date without being reached.")
 
 
 # ============ ADVANCED ANALYTICS ============
@@ -1052,24 +1220,17 @@ def advanced_analytics():
     with tab1:
         st.markdown("### Expense Pattern Analysis")
         
-        # Get expense data
-        conn = sqlite3.connect('finance_tracker.db')
-        df_expenses = pd.read_sql_query("""
-            SELECT date, amount, category 
-            FROM expenses 
-            WHERE user_id = ?
-        """, conn, params=(st.session_state.user_id,))
-        conn.close()
+        # Charts and the insights pivot read the rollup tables; the weekday
+        # pattern comes from the shared compact cache
+        user_id = st.session_state.user_id
+        monthly_expenses = rollups.monthly_totals(user_id)
         
-        if not df_expenses.empty:
-            df_expenses['date'] = pd.to_datetime(df_expenses['date'])
-            
+        if not monthly_expenses.empty:
             # Monthly Trend
-            monthly_expenses = df_expenses.groupby(df_expenses['date'].dt.strftime('%Y-%m'))[['amount']].sum()
-            
-            fig = px.line(monthly_expenses, x=monthly_expenses.index, y='amount',
+            monthly_trend = charting.downsample(monthly_expenses, 'amount')
+            fig = px.line(monthly_trend, x=monthly_trend.index, y='amount',
                          title='Monthly Expense Trend',
-                         labels={'amount': 'Amount (₹)', 'date': 'Month'})
+                         labels={'amount': 'Amount (₹)', 'month': 'Month'})
             st.plotly_chart(fig)
             
             # Category Analysis
@@ -1077,7 +1238,7 @@ def advanced_analytics():
             
             with col1:
                 # Category Distribution
-                category_expenses = df_expenses.groupby('category')['amount'].sum()
+                category_expenses = rollups.category_totals(user_id)['amount']
                 fig = px.pie(values=category_expenses.values,
                            names=category_expenses.index,
                            title='Expense Distribution by Category')
@@ -1085,8 +1246,7 @@ def advanced_analytics():
             
             with col2:
                 # Weekly Pattern
-                df_expenses['weekday'] = df_expenses['date'].dt.day_name()
-                weekly_expenses = df_expenses.groupby('weekday')['amount'].mean()
+                weekly_expenses = user_expenses(user_id).weekday_means()
                 
                 fig = px.bar(x=weekly_expenses.index,
                            y=weekly_expenses.values,
@@ -1094,89 +1254,120 @@ def advanced_analytics():
                            labels={'x': 'Day', 'y': 'Average Amount (₹)'})
                 st.plotly_chart(fig)
             
-            # Calculate metrics
-            total_monthly = df_expenses.groupby(df_expenses['date'].dt.strftime('%Y-%m'))['amount'].sum()
-            avg_monthly = total_monthly.mean()
-            std_monthly = total_monthly.std()
-            
-            # Generate insights
-            insights = []
-            
-            if total_monthly.iloc[-1] > avg_monthly + std_monthly:
-                insights.append("📈 Your spending this month is higher than usual.")
-            elif total_monthly.iloc[-1] < avg_monthly - std_monthly:
-                insights.append("📉 Your spending this month is lower than usual.")
+            # Every rule reads the rollup-backed category x month pivot
+            context = insights.load_context(user_id, weekly_expenses)
+            for insight in insights.evaluate(context):
+                st.info(insight)
             
-            # Category-specific insights
-            for category in df_expenses['category'].unique():
-                cat_data = df_expenses[df_expenses['category'] == category]
-                cat_monthly = cat_data.groupby(cat_data['date'].dt.strftime('%Y-%m'))['amount'].sum()
+            # Spending Forecast
+            st.markdown("### Spending Forecast")
+            model = forecasting.get_model(user_id)
+            if model is None:
+                st.info(f"Forecasts need at least {forecasting.MIN_MONTHS} complete months of expenses.")
+            else:
+                outlook = forecasting.forecast(model)
+                next_month, following = outlook.columns
+                last_total = model.history[-1, -1]
+                col1, col2 = st.columns(2)
+                col1.metric(f"Forecast for {next_month}", f"₹{outlook.loc[forecasting.TOTAL, next_month]:,.2f}",
+                            f"₹{outlook.loc[forecasting.TOTAL, next_month] - last_total:,.2f}",
+                            delta_color="inverse")
+                col2.metric(f"Forecast for {following}", f"₹{outlook.loc[forecasting.TOTAL, following]:,.2f}")
                 
-                if len(cat_monthly) > 1 and cat_monthly.iloc[-1] > cat_monthly.iloc[:-1].mean() * 1.2:
-                    insights.append(f"⚠️ {category} expenses have increased significantly.")
-            
-            for insight in insights:
-                st.info(insight)
+                by_category = outlook.drop(index=forecasting.TOTAL)[next_month]
+                by_category = by_category[by_category > 0].sort_values(ascending=False)
+                fig = px.bar(x=by_category.index, y=by_category.values,
+                           title=f'Forecast by Category, {next_month}',
+                           labels={'x': 'Category', 'y': 'Amount (₹)'})
+                st.plotly_chart(fig)
     
     with tab2:
         st.markdown("### Investment Performance Analysis")
         
-        # Sample investment data (replace with actual data)
-        investment_data = pd.DataFrame({
-            'Date': pd.date_range(start='2023-01-01', periods=12, freq='ME'),
-            'Equity': np.random.normal(12000, 2000, 12).cumsum(),
-            'Debt': np.random.normal(8000, 1000, 12).cumsum(),
-            'Gold': np.random.normal(5000, 500, 12).cumsum()
-        })
-        
-                # Portfolio Performance
-        fig = px.line(investment_data, x='Date',
-                     y=['Equity', 'Debt', 'Gold'],
-                     title='Portfolio Performance Over Time')
-        st.plotly_chart(fig)
-        
-        # Asset Allocation
-        current_allocation = {
-            'Asset': ['Equity', 'Debt', 'Gold'],
-            'Amount': [investment_data['Equity'].iloc[-1],
-                      investment_data['Debt'].iloc[-1],
-                      investment_data['Gold'].iloc[-1]]
-        }
-        df_allocation = pd.DataFrame(current_allocation)
-        
-        fig = px.pie(df_allocation, values='Amount', names='Asset',
-                    title='Current Asset Allocation')
-        st.plotly_chart(fig)
-        
-        # Performance Metrics
-        st.markdown("### Performance Metrics")
-        
-        col1, col2, col3 = st.columns(3)
+        with st.expander("Record a Transaction"):
+            with st.form("new_transaction"):
+                col1, col2, col3 = st.columns(3)
+                symbol = col1.text_input("Symbol", help="Yahoo Finance symbol, e.g. NIFTYBEES.NS")
+                asset_class = col2.selectbox("Asset Class", holdings.ASSET_CLASSES)
+                side = col3.selectbox("Type", ["Buy", "Sell"])
+                col1, col2, col3, col4 = st.columns(4)
+                trade_date = col1.date_input("Date")
+                quantity = col2.number_input("Units", min_value=0.0, value=1.0, format="%.4f")
+                price = col3.number_input("Price per Unit (₹)", min_value=0.0, value=100.0)
+                fees = col4.number_input("Fees (₹)", min_value=0.0, value=0.0)
+                if st.form_submit_button("Save Transaction"):
+                    signed = quantity if side == "Buy" else -quantity
+                    try:
+                        holdings.record_transaction(user_id, symbol, asset_class, trade_date, signed, price, fees)
+                        st.success("Transaction saved!")
+                    except holdings.LedgerError as e:
+                        st.error(str(e))
         
-        with col1:
-            total_value = df_allocation['Amount'].sum()
-            st.metric("Total Portfolio Value", f"₹{total_value:,.2f}")
+        transactions = holdings.load_transactions(user_id)
+        if transactions.empty:
+            st.info("Record your first investment transaction to see portfolio performance.")
+        else:
+            closes, error = valuation.price_history(transactions)
+            if error:
+                st.caption(f"{error} Valuing with the last stored prices.")
+            portfolio = valuation.value_portfolio(transactions, closes)
             
-        with col2:
-            # Safety check to ensure we're only working with numeric data
-            if 'Date' in investment_data.columns:
-                investment_data_numeric = investment_data.drop(columns=['Date'])
-            else:
-                investment_data_numeric = investment_data
-                
-            # Get the first row as a Series and filter out non-numeric values
-            first_row = investment_data_numeric.iloc[0]
-            # Instead of select_dtypes, manually filter numeric values
-            numeric_values = [value for value in first_row if isinstance(value, (int, float))]
-            investment_sum = sum(numeric_values) if numeric_values else 0
+            # Portfolio Performance
+            performance = pd.concat([portfolio.nav, portfolio.invested], axis=1)
+            performance = charting.downsample(performance, 'Value')
+            fig = px.line(performance, x=performance.index, y=['Value', 'Invested'],
+                         title='Portfolio Performance Over Time',
+                         labels={'value': 'Amount (₹)', 'index': 'Date', 'variable': ''})
+            st.plotly_chart(fig)
             
-            # Calculate returns
-            returns = (total_value - investment_sum) / investment_sum * 100 if investment_sum > 0 else 0
-            st.metric("Total Returns", f"{returns:.1f}%")
-        
-        with col3:
-            monthly_return = returns / 12
-            st.metric("Average Monthly Return", f"{monthly_return:.1f}%")
+            # Asset Allocation
+            current = portfolio.by_class.iloc[-1]
+            current = current[current > 0]
+            fig = px.pie(values=current.values, names=current.index,
+                        title='Current Asset Allocation')
+            st.plotly_chart(fig)
+            
+            # Performance Metrics
+            st.markdown("### Performance Metrics")
+            
+            days = (portfolio.nav.index[-1] - portfolio.nav.index[0]).days
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Total Portfolio Value", f"₹{portfolio.nav.iloc[-1]:,.2f}",
+                        delta=f"₹{portfolio.nav.iloc[-1] - portfolio.invested.iloc[-1]:,.2f}",
+                        help="Change is value minus net amount invested")
+            col2.metric("Time-Weighted Return", f"{portfolio.twr.iloc[-1]:.1%}",
+                        help=f"Annualized: {valuation.annualize(portfolio.twr.iloc[-1], days):.1%}. "
+                             "Ignores the timing of your deposits and withdrawals.")
+            col3.metric("XIRR", "–" if np.isnan(portfolio.xirr) else f"{portfolio.xirr:.1%}",
+                        help="Annualized money-weighted return of your actual cash flows")
+            
+            st.dataframe(portfolio.positions, hide_index=True, column_config={
+                'Units': st.column_config.NumberColumn(format="%.4f"),
+                'Price': st.column_config.NumberColumn(format="₹%.2f"),
+                'Value': st.column_config.NumberColumn(format="₹%.2f"),
+                'Weight': st.column_config.ProgressColumn(format="percent", min_value=0, max_value=1),
+            })
+            
+            # Capital Gains
+            st.markdown("### Capital Gains (FIFO)")
+            realized, open_lots = tax_lots.match(transactions)
+            marks = portfolio.positions.set_index('Symbol')['Price']
+            unrealized = tax_lots.unrealized(open_lots, marks)
+            open_gains = unrealized.groupby('term')['gain'].sum()
+            
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Realized Gains", f"₹{realized['gain'].sum():,.2f}")
+            col2.metric("Unrealized Short-Term", f"₹{open_gains.get('STCG', 0.0):,.2f}")
+            col3.metric("Unrealized Long-Term", f"₹{open_gains.get('LTCG', 0.0):,.2f}")
+            
+            if realized.empty:
+                st.caption("No sells recorded yet, so there are no realized gains.")
+            else:
+                st.dataframe(tax_lots.gains_by_year(realized).style.format('₹{:,.2f}'))
+                with st.expander("Matched Lots"):
+                    st.dataframe(realized, hide_index=True)
+            st.caption("Tax estimates follow the 2024 Budget rules and assume a "
+                       f"{tax_lots.SLAB_RATE:.0%} slab rate; they are not tax advice.")
 
     with tab3:
         st.markdown("### Financial Health Score")
@@ -1284,12 +1475,9 @@ def settings_page():
     
     with col1:
         # Get user info
-        conn = sqlite3.connect('finance_tracker.db')
-        c = conn.cursor()
-        c.execute("SELECT username, email FROM users WHERE id = ?", 
-                 (st.session_state.user_id,))
-        user_info = c.fetchone()
-        conn.close()
+        with connect() as conn:
+            user_info = conn.execute("SELECT username, email FROM users WHERE id = ?",
+                                     (st.session_state.user_id,)).fetchone()
         
         if user_info:
             username, email = user_info
@@ -1306,9 +1494,50 @@ def settings_page():
     
     # Notification Settings
     st.markdown("### Notification Settings")
-    st.checkbox("Email Alerts for Unusual Expenses", value=True)
-    st.checkbox("Monthly Report", value=True)
-    st.checkbox("Investment Alerts", value=True)
+    user_id = st.session_state.user_id
+    prefs = alerts.get_prefs(user_id)
+    chosen = {name: st.checkbox(label, value=prefs[name]) for name, label in alerts.PREFERENCES.items()}
+    if chosen != prefs:
+        alerts.save_prefs(user_id, chosen)
+        st.toast("Notification settings saved.")
+    
+    with st.expander("Monthly Budgets"):
+        st.caption("You are emailed when a category goes over its budget in a month. Leave a limit "
+                   "at 0 for no budget.")
+        budgets = alerts.get_budgets(user_id)
+        categories = sorted(set(rollups.category_totals(user_id).index) | set(budgets.index))
+        edited = st.data_editor(
+            pd.DataFrame({'Category': categories,
+                          'Monthly Limit': budgets.reindex(categories).fillna(0.0).to_numpy()}),
+            hide_index=True,
+            num_rows="dynamic",
+            column_config={'Monthly Limit': st.column_config.NumberColumn(format="₹%.2f", min_value=0)},
+            key="budget_editor",
+        )
+        if st.button("Save Budgets"):
+            alerts.save_budgets(user_id, dict(zip(edited['Category'], edited['Monthly Limit'])))
+            st.success("Budgets saved.")
+    
+    with st.expander("Price Alerts"):
+        with st.form("new_price_alert", clear_on_submit=True):
+            col1, col2, col3 = st.columns(3)
+            alert_symbol = col1.text_input("Symbol", help="Yahoo Finance symbol, e.g. RELIANCE.NS")
+            alert_direction = col2.selectbox("When Price Goes", alerts.DIRECTIONS, format_func=str.title)
+            alert_threshold = col3.number_input("Price (₹)", min_value=0.0, step=10.0)
+            if st.form_submit_button("Add Alert"):
+                try:
+                    alerts.add_price_alert(user_id, alert_symbol, alert_direction, alert_threshold)
+                except ValueError as e:
+                    st.error(str(e))
+        price_alerts = alerts.get_price_alerts(user_id)
+        if not price_alerts.empty:
+            st.dataframe(price_alerts.drop(columns='id'), hide_index=True)
+            remove = st.multiselect("Remove Alerts", price_alerts['id'],
+                                    format_func=lambda alert_id: "{symbol} {direction} {threshold:,.2f}".format(
+                                        **price_alerts.set_index('id').loc[alert_id]))
+            if remove and st.button("Remove Selected"):
+                alerts.remove_price_alerts(user_id, remove)
+                st.rerun()
     
     # Data Management
     st.markdown("### Data Management")
@@ -1316,41 +1545,27 @@ def settings_page():
     col1, col2 = st.columns(2)
     
     with col1:
-        if st.button("Export Data"):
-            # Get user's data
-            conn = sqlite3.connect('finance_tracker.db')
-            df_expenses = pd.read_sql_query("""
-                SELECT date, amount, category, description 
-                FROM expenses 
-                WHERE user_id = ?
-            """, conn, params=(st.session_state.user_id,))
-            
-            # Convert to CSV
-            csv = df_expenses.to_csv(index=False)
-            
-            # Create download button
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name="my_financial_data.csv",
-                mime="text/csv"
-            )
+        export_table = st.selectbox("Data to Export", list(EXPORTS),
+                                    format_func=lambda name: name.replace("_", " ").title())
+        export_format = st.selectbox("Export Format", list(FORMATS))
+
+        # Generated only when clicked. Streamlit serves download data from
+        # memory, so very large exports should use `python exporter.py`.
+        st.download_button(
+            label="Export Data",
+            data=lambda: export_bytes(export_table, user_id, export_format),
+            file_name=export_file_name(export_table, export_format),
+            mime=FORMATS[export_format][1],
+        )
     
     with col2:
         if st.button("Delete Account"):
             st.warning("⚠️ This will permanently delete your account and all associated data!")
             if st.button("Confirm Delete"):
-                conn = sqlite3.connect('finance_tracker.db')
-                c = conn.cursor()
-                # Delete user's data
-                c.execute("DELETE FROM expenses WHERE user_id = ?", 
-                         (st.session_state.user_id,))
-                c.execute("DELETE FROM goals WHERE user_id = ?", 
-                         (st.session_state.user_id,))
-                c.execute("DELETE FROM users WHERE id = ?", 
-                         (st.session_state.user_id,))
-                conn.commit()
-                conn.close()
+                with transaction() as conn:
+                    # Expenses and goals are removed by ON DELETE CASCADE
+                    conn.execute("DELETE FROM users WHERE id = ?",
+                                 (st.session_state.user_id,))
                 
                 # Clear session state
                 st.session_state.clear()
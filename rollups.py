@@ -0,0 +1,153 @@
+"""Read helpers and backfill for the expense rollup tables.
+
+The rollups (expense_daily, expense_monthly, expense_category_monthly) are kept
+current by triggers on expenses (see migration 3), and by add_batch() for bulk
+imports. Rebuild them from scratch with:
+
+    python rollups.py --rebuild [--user-id N]
+"""
+import argparse
+
+import pandas as pd
+
+from db import connect, transaction
+
+CATEGORY_EXPR = "COALESCE(NULLIF(category, ''), 'Uncategorized')"
+
+
+# ============ REBUILD ============
+def rebuild(conn, user_id=None):
+    """Recompute all rollups (or one user's) from expenses inside the caller's transaction."""
+    where, params = ("AND user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    for table in ('expense_daily', 'expense_monthly', 'expense_category_monthly'):
+        conn.execute(f"DELETE FROM {table} WHERE 1 = 1 {where}", params)
+
+    conn.execute(f"""
+        INSERT INTO expense_daily (user_id, day, total, count)
+        SELECT user_id, date, SUM(COALESCE(amount, 0)), COUNT(*)
+        FROM expenses WHERE date IS NOT NULL {where}
+        GROUP BY user_id, date
+    """, params)
+    conn.execute(f"""
+        INSERT INTO expense_monthly (user_id, month, total, count)
+        SELECT user_id, substr(date, 1, 7), SUM(COALESCE(amount, 0)), COUNT(*)
+        FROM expenses WHERE date IS NOT NULL {where}
+        GROUP BY user_id, substr(date, 1, 7)
+    """, params)
+    conn.execute(f"""
+        INSERT INTO expense_category_monthly (user_id, month, category, total, count)
+        SELECT user_id, substr(date, 1, 7), {CATEGORY_EXPR}, SUM(COALESCE(amount, 0)), COUNT(*)
+        FROM expenses WHERE date IS NOT NULL {where}
+        GROUP BY user_id, substr(date, 1, 7), {CATEGORY_EXPR}
+    """, params)
+
+
+def add_batch(conn, user_id, source, params=()):
+    """Fold a batch of new rows (date, amount, category) into the rollups.
+
+    Used by bulk writers whose rows bypass the per-row insert triggers; runs
+    inside the caller's transaction. `source` is a trusted table name or
+    parenthesised subquery whose placeholders are bound from `params`.
+    """
+    # GROUP BY before ON CONFLICT avoids the SELECT ... ON parsing ambiguity
+    conn.execute(f"""
+        INSERT INTO expense_daily (user_id, day, total, count)
+        SELECT ?, date, SUM(COALESCE(amount, 0)), COUNT(*)
+        FROM {source} WHERE date IS NOT NULL
+        GROUP BY date
+        ON CONFLICT (user_id, day) DO UPDATE
+        SET total = total + excluded.total, count = count + excluded.count
+    """, (user_id, *params))
+    conn.execute(f"""
+        INSERT INTO expense_monthly (user_id, month, total, count)
+        SELECT ?, substr(date, 1, 7), SUM(COALESCE(amount, 0)), COUNT(*)
+        FROM {source} WHERE date IS NOT NULL
+        GROUP BY substr(date, 1, 7)
+        ON CONFLICT (user_id, month) DO UPDATE
+        SET total = total + excluded.total, count = count + excluded.count
+    """, (user_id, *params))
+    conn.execute(f"""
+        INSERT INTO expense_category_monthly (user_id, month, category, total, count)
+        SELECT ?, substr(date, 1, 7), {CATEGORY_EXPR}, SUM(COALESCE(amount, 0)), COUNT(*)
+        FROM {source} WHERE date IS NOT NULL
+        GROUP BY substr(date, 1, 7), {CATEGORY_EXPR}
+        ON CONFLICT (user_id, month, category) DO UPDATE
+        SET total = total + excluded.total, count = count + excluded.count
+    """, (user_id, *params))
+
+
+# ============ READS ============
+def daily_totals(user_id):
+    """One row per day with spending: date (datetime64), amount, count."""
+    with connect() as conn:
+        df = pd.read_sql_query("""
+            SELECT day AS date, total AS amount, count
+            FROM expense_daily
+            WHERE user_id = ?
+            ORDER BY day
+        """, conn, params=(user_id,))
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def monthly_totals(user_id):
+    """Monthly totals indexed by 'YYYY-MM' month string, oldest first."""
+    with connect() as conn:
+        return pd.read_sql_query("""
+            SELECT month, total AS amount, count
+            FROM expense_monthly
+            WHERE user_id = ?
+            ORDER BY month
+        """, conn, params=(user_id,), index_col='month')
+
+
+def category_monthly(user_id):
+    """Long-form category x month totals: month, category, amount, count."""
+    with connect() as conn:
+        return pd.read_sql_query("""
+            SELECT month, category, total AS amount, count
+            FROM expense_category_monthly
+            WHERE user_id = ?
+            ORDER BY month, category
+        """, conn, params=(user_id,))
+
+
+def category_totals(user_id):
+    """All-time totals per category, largest first."""
+    with connect() as conn:
+        return pd.read_sql_query("""
+            SELECT category, SUM(total) AS amount, SUM(count) AS count
+            FROM expense_category_monthly
+            WHERE user_id = ?
+            GROUP BY category
+            ORDER BY amount DESC
+        """, conn, params=(user_id,), index_col='category')
+
+
+def weekday_means(daily):
+    """Average expense amount per weekday from a daily_totals() frame, Monday first."""
+    weekdays = daily['date'].dt.day_name()
+    grouped = daily.groupby(weekdays)[['amount', 'count']].sum()
+    order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    grouped = grouped.reindex([day for day in order if day in grouped.index])
+    return grouped['amount'] / grouped['count']
+
+
+# ============ CLI ============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain expense rollup tables.")
+    parser.add_argument('--rebuild', action='store_true', help="recompute rollups from expenses")
+    parser.add_argument('--user-id', type=int, help="limit the rebuild to one user")
+    args = parser.parse_args(argv)
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+    with transaction() as conn:
+        rebuild(conn, args.user_id)
+    scope = f"user {args.user_id}" if args.user_id is not None else "all users"
+    print(f"Rebuilt expense rollups for {scope}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""FIFO tax lots and capital gains from the transactions ledger.
+
+Matching works on the cumulative-units axis: instrument k's buys cover
+consecutive unit ranges, and FIFO pairs its n-th sold unit with its n-th
+bought unit. Cutting that axis at every buy and sell boundary yields each
+(buy, sell) match as one segment, so the whole ledger is matched with a sort
+and a few searchsorted calls instead of a per-trade loop.
+
+Rules follow the 2024 Indian budget and are an estimate, not tax advice.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# ============ CONFIG ============
+# long_term_months: held for more than this many months counts as long term;
+# None means gains are always short term (taxed at the slab rate)
+TaxRule = namedtuple('TaxRule', 'long_term_months stcg_rate ltcg_rate')
+SLAB_RATE = 0.30  # assumed marginal slab rate for gains taxed as income
+TAX_RULES = {
+    'Equity': TaxRule(12, 0.20, 0.125),
+    'Gold': TaxRule(24, SLAB_RATE, 0.125),
+    'Debt': TaxRule(None, SLAB_RATE, SLAB_RATE),
+    'Cash': TaxRule(None, SLAB_RATE, SLAB_RATE),
+    'Other': TaxRule(24, SLAB_RATE, 0.125),
+}
+EQUITY_LTCG_EXEMPTION = 125000.0  # per financial year
+EPSILON = 1e-9
+
+
+# ============ DATES ============
+def add_months(dates, months):
+    """Same day `months` later, clipped to the end of shorter months."""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    month = days.astype('datetime64[M]')
+    target = month + np.asarray(months)
+    length = (target + 1).astype('datetime64[D]') - target.astype('datetime64[D]')
+    offset = np.minimum(days - month.astype('datetime64[D]'), length - np.timedelta64(1, 'D'))
+    return target.astype('datetime64[D]') + offset
+
+
+def financial_year(dates):
+    """Indian financial year label (April to March), e.g. 'FY2025-26'."""
+    dates = pd.DatetimeIndex(dates)
+    years, inverse = np.unique(dates.year - (dates.month < 4), return_inverse=True)
+    labels = np.array([f"FY{year}-{(year + 1) % 100:02d}" for year in years], dtype=object)
+    return pd.Index(labels[inverse])
+
+
+def is_long_term(asset_classes, bought, held_until):
+    asset_classes = pd.Series(asset_classes)
+    months = asset_classes.map({name: np.nan if rule.long_term_months is None else rule.long_term_months
+                                for name, rule in TAX_RULES.items()}).to_numpy(dtype=float, copy=True)
+    months[~asset_classes.isin(list(TAX_RULES)).to_numpy()] = TAX_RULES['Other'].long_term_months
+    never = np.isnan(months)
+    deadline = add_months(bought, np.where(never, 0, months).astype(int))
+    return ~never & (np.asarray(held_until, dtype='datetime64[D]') > deadline)
+
+
+# ============ MATCHING ============
+def _prepare(transactions):
+    tx = transactions.reset_index(drop=True)
+    codes, symbols = pd.factorize(tx['symbol'])
+    order = np.lexsort((np.arange(len(tx)), codes))  # by instrument, keeping ledger order
+    tx = tx.iloc[order].reset_index(drop=True)
+    codes = codes[order]
+    quantity = tx['quantity'].to_numpy(dtype=float)
+    units = np.abs(quantity)
+    # Fees are spread over the units: they raise the cost and lower the proceeds
+    fees = tx['fees'].to_numpy(dtype=float) / units
+    per_unit = tx['price'].to_numpy(dtype=float) + np.where(quantity > 0, fees, -fees)
+    return tx, codes, len(symbols), quantity > 0, units, per_unit
+
+
+def match(transactions):
+    """FIFO-match sells to buys.
+
+    Returns (realized, open_lots). realized has one row per (buy, sell)
+    match: symbol, asset_class, bought, sold, units, cost, proceeds, gain,
+    term ('STCG'/'LTCG') and fy. open_lots has one row per buy with units
+    left: symbol, asset_class, bought, units, cost.
+    """
+    tx, codes, n_symbols, is_buy, units, per_unit = _prepare(transactions)
+    buy, sell = np.flatnonzero(is_buy), np.flatnonzero(~is_buy)
+
+    # Every instrument's buys and sells share one unit axis, offset by the
+    # units bought in the instruments before it
+    bought_by = np.bincount(codes[buy], units[buy], minlength=n_symbols)
+    sold_by = np.bincount(codes[sell], units[sell], minlength=n_symbols)
+    offset = np.concatenate([[0.0], np.cumsum(bought_by)[:-1]])
+    buy_end = np.cumsum(units[buy])
+    buy_start = buy_end - units[buy]
+    sold_before = np.concatenate([[0.0], np.cumsum(sold_by)[:-1]])
+    sell_end = np.cumsum(units[sell]) - sold_before[codes[sell]] + offset[codes[sell]]
+    sell_start = sell_end - units[sell]
+
+    edges = np.unique(np.concatenate([buy_start, buy_end, sell_start, sell_end]))
+    lengths = np.diff(edges)
+    mid = edges[:-1] + lengths / 2
+    s = np.searchsorted(sell_end, mid)
+    b = np.searchsorted(buy_end, mid)
+    inside = (s < len(sell)) & (b < len(buy)) & (lengths > EPSILON)
+    inside[inside] &= (sell_start[s[inside]] <= mid[inside]) & (codes[buy[b[inside]]] == codes[sell[s[inside]]])
+    s, b, lengths = s[inside], b[inside], lengths[inside]
+    buy_rows, sell_rows = buy[b], sell[s]
+
+    classes = tx['asset_class'].to_numpy()
+    bought = tx['date'].to_numpy()[buy_rows]
+    sold = tx['date'].to_numpy()[sell_rows]
+    cost = lengths * per_unit[buy_rows]
+    proceeds = lengths * per_unit[sell_rows]
+    realized = pd.DataFrame({
+        'symbol': tx['symbol'].to_numpy()[sell_rows],
+        'asset_class': classes[sell_rows],
+        'bought': bought,
+        'sold': sold,
+        'units': lengths,
+        'cost': cost,
+        'proceeds': proceeds,
+        'gain': proceeds - cost,
+        'term': np.where(is_long_term(classes[sell_rows], bought, sold), 'LTCG', 'STCG'),
+        'fy': financial_year(sold),
+    })
+
+    # Whatever of a buy lies past its instrument's last sold unit is still held
+    sold_until = offset + sold_by
+    remaining = np.clip(buy_end - np.maximum(buy_start, sold_until[codes[buy]]), 0.0, units[buy])
+    held = remaining > EPSILON
+    open_lots = pd.DataFrame({
+        'symbol': tx['symbol'].to_numpy()[buy[held]],
+        'asset_class': classes[buy[held]],
+        'bought': tx['date'].to_numpy()[buy[held]],
+        'units': remaining[held],
+        'cost': remaining[held] * per_unit[buy[held]],
+    })
+    return realized, open_lots
+
+
+# ============ REPORTS ============
+def unrealized(open_lots, marks, today=None):
+    """Open lots valued at `marks` (symbol -> price), classified by holding period as of `today`."""
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    value = open_lots['units'].to_numpy() * open_lots['symbol'].map(marks).to_numpy(dtype=float)
+    report = open_lots.assign(value=value, gain=value - open_lots['cost'].to_numpy())
+    long_term = is_long_term(open_lots['asset_class'], open_lots['bought'], np.full(len(open_lots), today))
+    report['term'] = np.where(long_term, 'LTCG', 'STCG')
+    return report
+
+
+def estimated_tax(gains):
+    """Tax on (asset_class, term) -> net gain for one financial year.
+
+    Losses only offset gains of the same class and term; equity LTCG gets the
+    annual exemption.
+    """
+    tax = 0.0
+    for (asset_class, term), gain in gains.items():
+        rule = TAX_RULES.get(asset_class, TAX_RULES['Other'])
+        if asset_class == 'Equity' and term == 'LTCG':
+            gain -= EQUITY_LTCG_EXEMPTION
+        tax += max(0.0, gain) * (rule.ltcg_rate if term == 'LTCG' else rule.stcg_rate)
+    return tax
+
+
+def gains_by_year(realized):
+    """Realized STCG/LTCG, total and estimated tax per financial year."""
+    if realized.empty:
+        return pd.DataFrame(columns=['STCG', 'LTCG', 'Total', 'Estimated Tax'])
+    net = realized.groupby(['fy', 'asset_class', 'term'])['gain'].sum()
+    report = realized.pivot_table(index='fy', columns='term', values='gain', aggfunc='sum', fill_value=0.0)
+    report = report.reindex(columns=['STCG', 'LTCG'], fill_value=0.0)
+    report['Total'] = report['STCG'] + report['LTCG']
+    report['Estimated Tax'] = [estimated_tax(net.loc[fy].to_dict()) for fy in report.index]
+    report.index.name = 'Financial Year'
+    return report
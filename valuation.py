@@ -0,0 +1,179 @@
+"""Portfolio valuation from the holdings ledger and the local price store.
+
+Positions, prices and cash flows are laid out as (day x holding) arrays, so a
+whole history is valued with a few cumulative sums and one matrix product:
+
+    >>> tx = holdings.load_transactions(user_id)
+    >>> v = value_portfolio(tx, price_store.read_closes(tx['symbol'].unique()))
+    >>> v.twr.iloc[-1], v.xirr
+
+Holdings without stored prices (or days before their first stored bar) are
+valued at their last transaction price.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import market_data
+import price_store
+
+DAYS_PER_YEAR = 365.25
+
+# nav, invested (cumulative net contributions) and twr (cumulative time-weighted
+# return) are daily Series; by_class is a daily DataFrame of value per asset
+# class; positions is the latest state per holding; xirr is annualized.
+Valuation = namedtuple('Valuation', 'nav invested twr by_class positions xirr')
+
+
+# ============ PRICES ============
+def held_symbols(transactions):
+    """Symbols in the order value_portfolio() expects price codes for."""
+    return tuple(pd.unique(transactions['symbol']))
+
+
+def price_history(transactions):
+    """Stored closes for a ledger, gap-filled at most once per cache TTL.
+
+    Each symbol is backfilled from its first transaction, however far back.
+    Returns (price_store.read_closes() frame, error message or None).
+    """
+    symbols = held_symbols(transactions)
+    first_trades = pd.to_datetime(transactions['date']).groupby(transactions['symbol']).min()
+    since = {symbol: day.date() for symbol, day in first_trades.items()}
+    snapshot = market_data.fetch_history(symbols, '5d', since=since)
+    start = min(since.values()) if since else None
+    return price_store.read_closes(symbols, start=start), snapshot.error
+
+
+def _day_numbers(index):
+    return np.asarray(index, dtype='datetime64[D]').astype(np.int64)
+
+
+def _forward_fill(values):
+    """Carry the last non-NaN value of each column down the rows."""
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+
+# ============ RETURNS ============
+def time_weighted_returns(nav, flows):
+    """Cumulative time-weighted return per day, with flows counted at the day's close."""
+    previous = np.concatenate([[0.0], nav[:-1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily = np.where(previous > 0, (nav - flows) / previous - 1,
+                         np.where(flows > 0, nav / flows - 1, 0.0))
+    return np.cumprod(1 + daily) - 1
+
+
+def xirr(amounts, dates):
+    """Annualized money-weighted return of dated cash flows (negative = paid in).
+
+    NPV is evaluated on a grid of rates in one pass to bracket the root, which
+    is then refined by bisection. NaN when the flows have no sign change.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    years = (pd.DatetimeIndex(dates) - pd.Timestamp(min(dates))).days.to_numpy() / DAYS_PER_YEAR
+    if not (amounts > 0).any() or not (amounts < 0).any():
+        return float('nan')
+
+    def npv(rates):
+        return (amounts / (1 + np.asarray(rates)[..., None]) ** years).sum(axis=-1)
+
+    grid = np.concatenate([np.linspace(-0.99, 1, 200), np.geomspace(1.01, 100, 100)])
+    values = npv(grid)
+    crossings = np.flatnonzero(np.sign(values[:-1]) != np.sign(values[1:]))
+    if not len(crossings):
+        return float('nan')
+    low, high = grid[crossings[0]], grid[crossings[0] + 1]
+    low_value = values[crossings[0]]
+    for _ in range(60):
+        mid = (low + high) / 2
+        mid_value = npv(mid)
+        if np.sign(mid_value) == np.sign(low_value):
+            low, low_value = mid, mid_value
+        else:
+            high = mid
+    return float((low + high) / 2)
+
+
+# ============ VALUATION ============
+def value_portfolio(transactions, closes, end=None):
+    """Daily valuation of a ledger from its first transaction to `end` (default today).
+
+    `transactions` is holdings.load_transactions() output and `closes` is
+    price_store.read_closes(held_symbols(transactions)) output.
+    """
+    end = pd.Timestamp(end or pd.Timestamp.now().normalize())
+    # Business days plus any weekend trade dates, as day numbers, with a
+    # day-number -> row lookup table so aligning rows needs no searching
+    tx_days = _day_numbers(transactions['date'])
+    days = np.arange(tx_days.min(), max(_day_numbers([end])[0], tx_days.max()) + 1)
+    keep = np.is_busday(days.astype('datetime64[D]'))
+    keep[tx_days - days[0]] = True
+    days = days[keep]
+    row_of_day = np.full(days[-1] - days[0] + 1, -1)
+    row_of_day[days - days[0]] = np.arange(len(days))
+    dates = pd.DatetimeIndex(days.astype('datetime64[D]').astype('datetime64[ns]'))
+
+    symbols = pd.Index(held_symbols(transactions))
+    row = row_of_day[tx_days - days[0]]
+    col = symbols.get_indexer(transactions['symbol'])
+    quantity = transactions['quantity'].to_numpy(dtype=float)
+    price = transactions['price'].to_numpy(dtype=float)
+    shape = (len(dates), len(symbols))
+
+    units = np.zeros(shape)
+    np.add.at(units, (row, col), quantity)
+    units = np.cumsum(units, axis=0)
+
+    # Stored closes win over trade prices on the same day; both carry forward
+    bar_days = closes['day'].to_numpy() - days[0]
+    in_range = (bar_days >= 0) & (bar_days < len(row_of_day))
+    bar_rows = row_of_day[bar_days[in_range]]
+    listed = bar_rows >= 0
+    marks = np.full(shape, np.nan)
+    marks[row, col] = price
+    marks[bar_rows[listed], closes['code'].to_numpy()[in_range][listed]] = \
+        closes['close'].to_numpy(dtype=float)[in_range][listed]
+    marks = _forward_fill(marks)
+    values = np.nan_to_num(units * marks)
+    nav = values.sum(axis=1)
+
+    flows = np.zeros(len(dates))
+    np.add.at(flows, row, quantity * price + transactions['fees'].to_numpy(dtype=float))
+
+    classes = transactions.drop_duplicates('symbol').set_index('symbol')['asset_class'].reindex(symbols)
+    class_index = pd.Index(classes.unique())
+    membership = np.zeros((len(symbols), len(class_index)))
+    membership[np.arange(len(symbols)), class_index.get_indexer(classes)] = 1.0
+    by_class = pd.DataFrame(values @ membership, index=dates, columns=class_index)
+
+    positions = pd.DataFrame({
+        'Symbol': symbols,
+        'Asset Class': classes.to_numpy(),
+        'Units': units[-1],
+        'Price': marks[-1],
+        'Value': values[-1],
+    })
+    positions['Weight'] = positions['Value'] / nav[-1] if nav[-1] else 0.0
+    positions = positions[positions['Units'].abs() > 1e-9].reset_index(drop=True)
+
+    cash_flows = np.append(-flows[flows != 0], nav[-1])
+    flow_dates = dates[flows != 0].append(pd.DatetimeIndex([dates[-1]]))
+    return Valuation(
+        pd.Series(nav, index=dates, name='Value'),
+        pd.Series(np.cumsum(flows), index=dates, name='Invested'),
+        pd.Series(time_weighted_returns(nav, flows), index=dates, name='TWR'),
+        by_class,
+        positions,
+        xirr(cash_flows, flow_dates),
+    )
+
+
+def annualize(total_return, days):
+    """Annualized equivalent of a cumulative return earned over `days` calendar days."""
+    if days <= 0:
+        return float('nan')
+    return (1 + total_return) ** (DAYS_PER_YEAR / days) - 1
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from db import connect, transaction
+from market_data import DEFAULT_SYMBOLS
+
+
+def normalize_symbol(symbol):
+    return symbol.strip().upper()
+
+
+def get_watchlist(user_id):
+    """The user's symbols, oldest first; DEFAULT_SYMBOLS until they first edit their watchlist."""
+    with connect() as conn:
+        customized = conn.execute("SELECT watchlist_customized FROM users WHERE id = ?",
+                                  (user_id,)).fetchone()
+        if not customized or not customized[0]:
+            return DEFAULT_SYMBOLS
+        rows = conn.execute("""
+            SELECT symbol FROM watchlists
+            WHERE user_id = ?
+            ORDER BY added_at, symbol
+        """, (user_id,)).fetchall()
+    return tuple(symbol for symbol, in rows)
+
+
+def _materialize_defaults(conn, user_id, now):
+    # The first edit turns the implicit default list into real rows; after
+    # that the stored rows are the whole watchlist, even when empty
+    updated = conn.execute("UPDATE users SET watchlist_customized = 1 WHERE id = ? AND watchlist_customized = 0",
+                           (user_id,)).rowcount
+    if updated:
+        conn.executemany("INSERT OR IGNORE INTO watchlists (user_id, symbol, added_at) VALUES (?, ?, ?)",
+                         [(user_id, symbol, now) for symbol in DEFAULT_SYMBOLS])
+
+
+def add_symbols(user_id, symbols):
+    symbols = [normalize_symbol(symbol) for symbol in symbols if symbol.strip()]
+    if not symbols:
+        return
+    now = datetime.now().isoformat(timespec='seconds')
+    with transaction() as conn:
+        _materialize_defaults(conn, user_id, now)
+        conn.executemany("INSERT OR IGNORE INTO watchlists (user_id, symbol, added_at) VALUES (?, ?, ?)",
+                         [(user_id, symbol, now) for symbol in dict.fromkeys(symbols)])
+
+
+def remove_symbols(user_id, symbols):
+    now = datetime.now().isoformat(timespec='seconds')
+    with transaction() as conn:
+        _materialize_defaults(conn, user_id, now)
+        conn.executemany("DELETE FROM watchlists WHERE user_id = ? AND symbol = ?",
+                         [(user_id, symbol) for symbol in symbols])